@@ -1,7 +1,10 @@
 from .robot import Robot
 from .server import RobotServer
 from .client import RobotClient
+from .async_client import AsyncRobotClient
+from .proxy import Relay, LastValueCache
 
 __version__ = '0.17.0'
 
-__all__ = [Robot, RobotServer, RobotClient]
+__all__ = [Robot, RobotServer, RobotClient, AsyncRobotClient, Relay,
+           LastValueCache]
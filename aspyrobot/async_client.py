@@ -0,0 +1,233 @@
+from collections import OrderedDict
+from itertools import count
+import asyncio
+
+import zmq
+import zmq.asyncio
+
+from .exceptions import RobotError
+from .serialization import (get_codec, pack_message, unpack_message,
+                            subscription_topics)
+
+
+class AsyncRobotClient:
+    """
+    An ``asyncio`` version of ``RobotClient``. It uses the same protocol as
+    ``RobotClient`` but runs entirely in the event loop without any threads.
+    Works with the default ``asyncio`` event loop, which needs pyzmq 17 or
+    later.
+
+    Args:
+        update_addr: Address of the ``RobotServer`` update socket.
+        request_addr: Address of the ``RobotServer`` operation request socket.
+        codec: Message codec, must match the ``RobotServer`` codec.
+        attrs: Names of the robot attributes to receive updates for. Defaults to
+            all attributes.
+
+    Example::
+
+        client = AsyncRobotClient()
+        await client.setup()
+        reply = await client.run_operation('clear', level='status')
+        await client.wait_for_operation(reply['handle'])
+        async for values in client.updates():
+            print(values)
+
+    """
+    FINISHED_OPERATIONS_LIMIT = 100
+    UPDATE_QUEUE_SIZE = 1000
+
+    def __init__(self, update_addr='tcp://localhost:2000',
+                 request_addr='tcp://localhost:2001', codec='json', attrs=None):
+        self.codec = get_codec(codec)
+        self._topics = subscription_topics(attrs)
+        self._request_addr = request_addr
+        self._update_addr = update_addr
+        self._zmq_context = zmq.asyncio.Context()
+        self._request_ids = count(1)
+        self._pending_requests = {}
+        self._operation_waiters = {}
+        self._finished_operations = OrderedDict()
+        self._update_queues = set()
+        self._tasks = []
+
+    async def setup(self):
+        self._request_socket = self._zmq_context.socket(zmq.DEALER)
+        self._request_socket.connect(self._request_addr)
+        self._update_socket = self._zmq_context.socket(zmq.SUB)
+        self._update_socket.connect(self._update_addr)
+        for topic in self._topics:
+            self._update_socket.setsockopt(zmq.SUBSCRIBE, topic)
+        self._tasks = [asyncio.ensure_future(self._reply_monitor()),
+                       asyncio.ensure_future(self._update_monitor())]
+        await self.refresh()
+
+    def close(self):
+        """Stop monitoring the server and close the sockets."""
+        for task in self._tasks:
+            task.cancel()
+        self._request_socket.close(linger=0)
+        self._update_socket.close(linger=0)
+        self._zmq_context.term()
+
+    async def _reply_monitor(self):
+        """Pass replies from the server to the waiting requests."""
+        while True:
+            _, *frames = await self._request_socket.recv_multipart(copy=False)
+            reply = unpack_message(self.codec, frames)
+            future = self._pending_requests.pop(reply.pop('id', None), None)
+            if future is not None and not future.done():
+                future.set_result(reply)
+
+    async def _update_monitor(self):
+        """Handle value and operation updates from the server."""
+        while True:
+            _, *frames = await self._update_socket.recv_multipart(copy=False)
+            message = unpack_message(self.codec, frames)
+            if message['type'] == 'values':
+                self._handle_values(message.get('data', {}))
+            elif message['type'] == 'operation':
+                self._handle_operation(message)
+
+    def _handle_values(self, values):
+        self.__dict__.update(values)
+        for queue in self._update_queues:
+            if queue.full():
+                queue.get_nowait()  # Drop the oldest update for slow iterators
+            queue.put_nowait(values)
+
+    def _handle_operation(self, message):
+        if message.get('stage') != 'end':
+            return
+        handle = message.get('handle')
+        self._finished_operations[handle] = message
+        while len(self._finished_operations) > self.FINISHED_OPERATIONS_LIMIT:
+            self._finished_operations.popitem(last=False)
+        for future in self._operation_waiters.pop(handle, []):
+            if not future.done():
+                future.set_result(message)
+
+    async def _request(self, request):
+        request_id = next(self._request_ids)
+        future = asyncio.get_event_loop().create_future()
+        self._pending_requests[request_id] = future
+        frames = pack_message(self.codec, dict(request, id=request_id))
+        await self._request_socket.send_multipart([b''] + frames)
+        return await future
+
+    async def run_query(self, query_name, **parameters):
+        """Fetch data from the ``RobotServer``.
+
+        Args:
+            query_name (str): Name of the ``RobotServer`` method to run.
+            **parameters: keyword arguments to be passed to the query method.
+
+        Raises:
+            RobotError: Error happened on the server.
+
+        """
+        reply = await self._request({'operation': query_name,
+                                     'parameters': parameters})
+        if reply.get('error') is not None:
+            raise RobotError(reply['error'])
+        return reply.get('data', {})
+
+    async def run_operation(self, operation, **parameters):
+        """Start an operation on the ``RobotServer``.
+
+        Returns the server reply containing the operation ``handle``. Use
+        ``wait_for_operation`` to wait for the operation to finish.
+
+        Args:
+            operation (str): Name of the ``RobotServer`` method to run.
+            **parameters: keyword arguments to be passed to the operation method.
+
+        Raises:
+            ValueError: Invalid operation name or parameters.
+
+        """
+        reply = await self._request({'operation': operation,
+                                     'parameters': parameters})
+        if reply.get('error') is not None:
+            raise ValueError(reply['error'])  # Invalid operation or parameters
+        return reply
+
+    async def wait_for_operation(self, handle):
+        """Wait for an operation to finish.
+
+        Args:
+            handle (int): Operation handle returned by ``run_operation``.
+
+        Returns: The message from the operation's ``'end'`` stage.
+
+        Raises:
+            RobotError: The operation finished with an error.
+
+        """
+        message = self._finished_operations.get(handle)
+        if message is None:
+            future = asyncio.get_event_loop().create_future()
+            self._operation_waiters.setdefault(handle, []).append(future)
+            message = await future
+        if message.get('error') is not None:
+            raise RobotError(message['error'])
+        return message.get('message')
+
+    def updates(self):
+        """Iterate over robot value updates.
+
+        Use with ``async for``. Each item is a dictionary of the attributes
+        that changed and their new values. At most ``UPDATE_QUEUE_SIZE`` updates
+        are kept waiting, older ones are dropped. Use with ``async with`` or call
+        ``aclose`` to stop receiving updates.
+
+        Example::
+
+            async with client.updates() as updates:
+                async for values in updates:
+                    print(values)
+
+        """
+        return _UpdateIterator(self)
+
+    async def refresh(self):
+        data = await self.run_query('refresh')
+        self.__dict__.update(data)
+
+    async def clear(self, level):
+        """
+        Clear the robot state.
+
+        Args:
+            level (str): 'status' or 'all'
+
+        """
+        return await self.run_operation('clear', level=level)
+
+
+class _UpdateIterator:
+    """Async iterator over the value updates received by an AsyncRobotClient."""
+
+    def __init__(self, client):
+        self._client = client
+        self._queue = asyncio.Queue(maxsize=client.UPDATE_QUEUE_SIZE)
+        client._update_queues.add(self._queue)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._queue.get()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop receiving updates."""
+        self._client._update_queues.discard(self._queue)
+
+    async def aclose(self):
+        self.close()
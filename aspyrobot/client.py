@@ -1,9 +1,15 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from itertools import count
 from threading import Thread, Lock
-from queue import Queue
+import time
+import uuid
 
 import zmq
 
 from .exceptions import RobotError
+from .serialization import (get_codec, pack_message, unpack_message,
+                            subscription_topics)
 
 
 class RobotClient:
@@ -14,6 +20,25 @@ class RobotClient:
     Args:
         update_addr: Address of the ``RobotServer`` update socket.
         request_addr: Address of the ``RobotServer`` operation request socket.
+        codec: Message codec, must match the ``RobotServer`` codec.
+        attrs: Names of the robot attributes to receive updates for. Defaults to
+            all attributes. Missed value updates are only detected and recovered
+            when receiving all attributes. Requires a ``RobotServer`` with
+            ``split_values`` enabled.
+        operations: ``True`` to receive updates for all operations, ``False``
+            for none or a list of operation handles. Operation callbacks are only
+            called for operations the client is subscribed to.
+        initial_sync: Fetch the robot state from the server during ``setup``.
+            Can be ``False`` when connecting through a ``LastValueCache`` that
+            sends the latest values on subscription. The state is still
+            fetched if no values are replayed within ``REPLAY_TIMEOUT``
+            seconds, eg because the cache is empty.
+        dispatcher: A ``Dispatcher`` from ``aspyrobot.dispatch`` to deliver
+            value and operation callbacks on another thread, eg a GUI thread.
+            By default callbacks are called on the client's update thread.
+        operation_callback_timeout (float): Seconds after which an operation
+            callback is forgotten if the operation's ``'end'`` update hasn't
+            arrived. Callbacks are otherwise kept until the ``'end'`` update.
 
     Attributes:
         status (int): Robot status flag
@@ -30,46 +55,105 @@ class RobotClient:
         closest_point (int): Closest labelled point to the robot's coordinates
 
     """
+    REPLAY_TIMEOUT = 1.
+    MAX_UNSYNCED_VALUES = 1000
+
     def __init__(self, update_addr='tcp://localhost:2000',
-                 request_addr='tcp://localhost:2001'):
+                 request_addr='tcp://localhost:2001', codec='json', attrs=None,
+                 operations=True, initial_sync=True, dispatcher=None,
+                 operation_callback_timeout=None):
+        self._subscribers = {}
         self.delegate = None
+        self.dispatcher = dispatcher
+        self.initial_sync = initial_sync
+        self.codec = get_codec(codec)
+        self._topics = subscription_topics(attrs, operations)
+        self._track_sequence = attrs is None
+        self._sequence = None
+        self._sequence_lock = Lock()
+        # Values received before the initial state, newest kept
+        self._unsynced_values = deque(maxlen=self.MAX_UNSYNCED_VALUES)
         self._request_addr = request_addr
         self._update_addr = update_addr
         self._zmq_context = zmq.Context()
-        self._request_queue = Queue()
-        self._reply_queue = Queue()
+        self._submit_addr = 'inproc://aspyrobot-client-requests-%x' % id(self)
+        self._submit_lock = Lock()
+        self._request_ids = count(1)
+        self._pending_requests = {}
         self._operation_lock = Lock()
         self._operation_callbacks = {}
+        self.operation_callback_timeout = operation_callback_timeout
+        self._operation_expiry = OrderedDict()  # Handle to expiry time
+        self._correlation_prefix = uuid.uuid4().hex
+        self._correlation_ids = count(1)
 
     def setup(self):
+        requests = self._zmq_context.socket(zmq.PULL)
+        requests.bind(self._submit_addr)
+        self._submit_socket = self._zmq_context.socket(zmq.PUSH)
+        self._submit_socket.connect(self._submit_addr)
         self._request_thread = Thread(target=self._request_monitor,
-                                      args=(self._request_addr,), daemon=True)
+                                      args=(self._request_addr, requests),
+                                      daemon=True)
         self._update_thread = Thread(target=self._update_monitor,
                                      args=(self._update_addr,), daemon=True)
         self._request_thread.start()
         self._update_thread.start()
-        self.refresh()
+        if self.initial_sync:
+            self._sync(notify=False)
 
-    def _request_monitor(self, addr):
+    def _request_monitor(self, addr, requests):
         """
-        Set up a request socket to the server and transmit any messages added to
-        the request queue.
+        Set up a request socket to the server, transmit any requests submitted by
+        other threads and pass replies to the waiting futures.
 
         """
-        socket = self._zmq_context.socket(zmq.REQ)
+        socket = self._zmq_context.socket(zmq.DEALER)
         socket.connect(addr)
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        poller.register(requests, zmq.POLLIN)
         while True:
-            self._handle_request(socket)  # Blocks between requests
+            events = dict(poller.poll())  # Blocks between requests
+            if requests in events:
+                # Empty delimiter frame so the server sees a REQ style envelope
+                socket.send_multipart([b''] + requests.recv_multipart(copy=False),
+                                      copy=False)
+            if socket in events:
+                self._handle_reply(socket)
+
+    def _handle_reply(self, socket):
+        """
+        Receive a reply from the server and resolve the future of the matching
+        request.
+
+        """
+        _, *frames = socket.recv_multipart(copy=False)  # Drop empty delimiter
+        reply = unpack_message(self.codec, frames)
+        future, handle_reply = self._pending_requests.pop(reply.pop('id', None),
+                                                          (None, None))
+        if future is None:
+            return
+        try:
+            future.set_result(handle_reply(reply))
+        except Exception as e:
+            future.set_exception(e)
 
-    def _handle_request(self, socket):
+    def _submit(self, request, handle_reply):
         """
-        Send operation requests to the server and put the reply on a queue.
+        Send a request to the server without waiting for the reply.
+
+        Returns a future that resolves to the reply processed by
+        ``handle_reply``.
 
         """
-        request = self._request_queue.get()
-        socket.send_json(request)
-        reply = socket.recv_json()
-        self._reply_queue.put(reply)
+        future = Future()
+        with self._submit_lock:
+            request_id = next(self._request_ids)
+            self._pending_requests[request_id] = (future, handle_reply)
+            frames = pack_message(self.codec, dict(request, id=request_id))
+            self._submit_socket.send_multipart(frames)
+        return future
 
     def _update_monitor(self, addr):
         """
@@ -78,8 +162,18 @@ class RobotClient:
         """
         socket = self._zmq_context.socket(zmq.SUB)
         socket.connect(addr)
-        socket.setsockopt(zmq.SUBSCRIBE, b'')
+        for topic in self._topics:
+            socket.setsockopt(zmq.SUBSCRIBE, topic)
+        replay_deadline = None
+        if not self.initial_sync and self._track_sequence:
+            replay_deadline = time.monotonic() + self.REPLAY_TIMEOUT
         while True:
+            if replay_deadline is not None:
+                timeout = replay_deadline - time.monotonic()
+                if timeout <= 0 or not socket.poll(timeout * 1000):
+                    replay_deadline = None
+                    self._sync_if_not_replayed()
+                    continue
             self._handle_update(socket)  # Blocks between updates
 
     def _handle_update(self, socket):
@@ -88,17 +182,131 @@ class RobotClient:
         received.
 
         """
-        message = socket.recv_json()
+        _, *frames = socket.recv_multipart(copy=False)  # Drop topic frame
+        message = unpack_message(self.codec, frames)
         if message['type'] == 'values':
-            self._handle_values(message.get('data', {}))
+            self._handle_sequenced_values(message)
         elif message['type'] == 'operation':
+            handle = message.get('handle')
+            keys = (message.get('correlation_id'), handle)
             with self._operation_lock:
-                callback = self._operation_callbacks.get(message['handle'])
-            if callback:
-                callback(handle=message.get('handle'),
-                         stage=message.get('stage'),
-                         message=message.get('message'),
-                         error=message.get('error'))
+                entry = (self._operation_callbacks.get(keys[0]) or
+                         self._operation_callbacks.get(handle))
+                if message.get('stage') == 'end':
+                    for key in keys:
+                        self._operation_callbacks.pop(key, None)
+                        self._operation_expiry.pop(key, None)
+            if entry is None:
+                return
+            callback, completion = entry
+            if callback is not None:
+                kwargs = dict(handle=handle,
+                              stage=message.get('stage'),
+                              message=message.get('message'),
+                              error=message.get('error'))
+                if self.dispatcher is not None:
+                    self.dispatcher.post(None, callback, **kwargs)
+                else:
+                    callback(**kwargs)
+            if completion is not None and message.get('stage') == 'end':
+                # Resolved here rather than by the dispatcher so a GUI thread
+                # can wait on it
+                _complete(completion, message)
+
+    def _handle_sequenced_values(self, message):
+        """
+        Apply a values message in sequence order. Messages that have already
+        been applied are ignored and missed messages are fetched from the server.
+
+        Cached values replayed by a ``LastValueCache`` all carry the latest
+        sequence number and are used to sync the client if it hasn't synced yet.
+
+        """
+        sequence = message.get('sequence')
+        if not self._track_sequence and message.get('replay'):
+            # Without sequence numbers only replayed values that changed are new
+            data = message.get('data', {})
+            changed = {attr: value for attr, value in data.items()
+                       if _changed(self.__dict__.get(attr, _MISSING), value)}
+            return self._handle_values(changed)
+        if not self._track_sequence or sequence is None:
+            return self._handle_values(message.get('data', {}))
+        if message.get('replay'):
+            return self._handle_replayed_values(message)
+        with self._sequence_lock:
+            if self._sequence is None:
+                # Hold on to updates until the initial state arrives
+                self._unsynced_values.append(message)
+                return
+            expected = self._sequence + 1
+            if sequence < expected:
+                return
+            if sequence == expected:
+                self._sequence = sequence
+        if sequence > expected:
+            self._catch_up()
+            with self._sequence_lock:
+                if sequence <= self._sequence:
+                    return
+                self._sequence = sequence
+        self._handle_values(message.get('data', {}))
+
+    def _handle_replayed_values(self, message):
+        """Apply cached values sent by a ``LastValueCache`` on subscription.
+
+        The cache replays to every subscriber of the topic whenever a client
+        joins, so replays the client is already up to date with are ignored.
+
+        """
+        sequence = message['sequence']
+        unsynced = []
+        with self._sequence_lock:
+            behind = self._sequence is not None
+            if self._sequence is None and self.initial_sync:
+                # The initial sync is in flight, keep it silent
+                self._unsynced_values.append(message)
+                return
+            if self._sequence is None:
+                self._sequence = sequence
+                unsynced = list(self._unsynced_values)
+                self._unsynced_values.clear()
+            elif sequence <= self._sequence:
+                return
+        if behind:
+            self._catch_up()
+            with self._sequence_lock:
+                if sequence <= self._sequence:
+                    return
+        self._handle_values(message.get('data', {}))
+        for message in unsynced:
+            self._handle_sequenced_values(message)
+
+    def _sync_if_not_replayed(self):
+        """
+        Fetch the robot state if no cached values have been replayed, eg
+        because the cache was empty or the server doesn't have one.
+
+        """
+        with self._sequence_lock:
+            synced = self._sequence is not None
+        if not synced:
+            self._sync(notify=True)
+
+    def _catch_up(self):
+        """
+        Fetch the value updates missed since the last applied sequence number.
+        Falls back to a full ``sync`` if the server no longer has them.
+
+        """
+        try:
+            changes = self.run_query('changes_since', sequence=self._sequence)
+        except RobotError:
+            return self.sync()
+        with self._sequence_lock:
+            if changes['sequence'] <= self._sequence:
+                return
+            self._sequence = changes['sequence']
+        self._handle_values(changes['data'])
 
     def _handle_values(self, values):
         """
@@ -106,15 +314,86 @@ class RobotClient:
         run event handler methods.
 
         """
+        self.__dict__.update(values)
+        callbacks = self._callbacks
         for attr, value in values.items():
-            setattr(self, attr, value)
-            callback = getattr(self, 'on_' + attr, None)
-            if callback is not None:
+            try:
+                attr_callbacks = callbacks[attr]
+            except KeyError:
+                attr_callbacks = callbacks[attr] = self._find_callbacks(attr)
+            if self.dispatcher is not None:
+                if attr_callbacks:
+                    # Only the newest value is delivered if several arrive
+                    # before the dispatcher flushes
+                    self.dispatcher.post(('values', attr), _call_all,
+                                         attr_callbacks, value)
+                continue
+            for callback in attr_callbacks:
                 callback(value)
-            if self.delegate is not None:
-                callback = getattr(self.delegate, 'on_' + attr, None)
-                if callback is not None:
-                    callback(value)
+
+    def _find_callbacks(self, attr):
+        """
+        Return the ``on_<attr>`` handlers of self and the delegate followed by
+        the subscribed callbacks for an attribute.
+
+        """
+        callbacks = []
+        for target in (self, self.delegate):
+            callback = getattr(target, 'on_' + attr, None)
+            if callback is not None:
+                callbacks.append(callback)
+        callbacks.extend(self._subscribers.get(attr, ()))
+        return tuple(callbacks)
+
+    def __setattr__(self, name, value):
+        if name == 'delegate' or name.startswith('on_'):
+            # Handlers have changed so the callback table needs rebuilding
+            object.__setattr__(self, '_callbacks', {})
+        object.__setattr__(self, name, value)
+
+    def subscribe(self, attr, callback):
+        """Call ``callback`` with the new value whenever ``attr`` changes.
+
+        Subscribed callbacks run after any ``on_<attr>`` handlers on the client
+        and its delegate.
+
+        Args:
+            attr (str): Robot attribute name.
+            callback: Function to call with the value.
+
+        """
+        subscribers = dict(self._subscribers)
+        subscribers[attr] = subscribers.get(attr, ()) + (callback,)
+        self._subscribers = subscribers
+        self._callbacks = {}
+
+    def unsubscribe(self, attr, callback):
+        """Stop calling a callback registered with ``subscribe``."""
+        subscribers = dict(self._subscribers)
+        remaining = list(subscribers.get(attr, ()))
+        remaining.remove(callback)
+        subscribers[attr] = tuple(remaining)
+        self._subscribers = subscribers
+        self._callbacks = {}
+
+    def submit_query(self, query_name, **parameters):
+        """Fetch data from the ``RobotServer`` without blocking.
+
+        Args:
+            query_name (str): Name of the ``RobotServer`` method to run.
+            **parameters: keyword arguments to be passed to the query method.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the query data. Raises
+            ``RobotError`` if an error happened on the server.
+
+        """
+        def handle_reply(reply):
+            if reply.get('error') is not None:
+                raise RobotError(reply['error'])
+            return reply.get('data', {})
+        return self._submit({'operation': query_name, 'parameters': parameters},
+                            handle_reply)
 
     def run_query(self, query_name, **parameters):
         """Fetch data from the ``RobotServer``.
@@ -128,18 +407,143 @@ class RobotClient:
         Raises:
             RobotError: Error happened on the server.
 
+        """
+        return self.submit_query(query_name, **parameters).result()
+
+    def submit_operation(self, operation, callback=None, priority=None,
+                         deadline=None, **parameters):
+        """Start an operation on the ``RobotServer`` without blocking.
+
+        Args:
+            operation (str): Name of the ``RobotServer`` method to run.
+            **parameters: keyword arguments to be passed to the operation method.
+            callback: Callback function to receive updates about the operation.
+                Should handle arguments:
+                ``handle``, ``stage``, ``message``, ``error``
+            priority (int): Foreground operations with a higher priority leave
+                the server's foreground queue first.
+            deadline (float): Seconds a foreground operation may wait in the
+                server's foreground queue before it is abandoned.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the server reply containing
+            the operation ``handle``. Raises ``ValueError`` for an invalid
+            operation name or parameters.
+
+        """
+        return self._submit_operation(operation, parameters, callback, priority,
+                                      deadline)
+
+    def _submit_operation(self, operation, parameters, callback, priority,
+                          deadline, completion=None):
+        """
+        Send an operation request. ``completion`` is an optional future to
+        resolve with the operation's ``'end'`` update.
+
+        """
+        request = {'operation': operation, 'parameters': parameters}
+        correlation_id = self._prepare_operation_request(request, callback,
+                                                         completion)
+
+        def handle_reply(reply):
+            self._handle_operation_reply(reply, correlation_id)
+            if reply.get('error') is not None:
+                raise ValueError(reply['error'])  # Invalid operation or parameters
+            return reply
+        if priority is not None:
+            request['priority'] = priority
+        if deadline is not None:
+            request['deadline'] = deadline
+        return self._submit(request, handle_reply)
+
+    def _prepare_operation_request(self, request, callback, completion=None):
+        """
+        Give an operation request a correlation id and register its callback
+        and completion future under the id before the request is sent. The
+        server includes the id in the operation's updates so none are missed
+        while waiting for the reply with the handle.
+
+        """
+        if not callback and completion is None:
+            return None
+        correlation_id = '%s:%d' % (self._correlation_prefix,
+                                    next(self._correlation_ids))
+        request['correlation_id'] = correlation_id
+        self._register_operation_callback(correlation_id,
+                                          (callback or None, completion))
+        return correlation_id
+
+    def _handle_operation_reply(self, reply, correlation_id):
+        """
+        Forget the callback if the request failed. Otherwise, if the server
+        didn't echo the correlation id, it won't include it in updates so also
+        register the callback by handle unless the operation has already ended.
+
+        """
+        if correlation_id is None:
+            return
+        if reply.get('error') is not None or reply.get('handle') is None:
+            with self._operation_lock:
+                self._operation_callbacks.pop(correlation_id, None)
+                self._operation_expiry.pop(correlation_id, None)
+            return
+        if reply.get('correlation_id') == correlation_id:
+            return
+        # Held throughout so an 'end' update can't remove the callback between
+        # the lookup and registering it by handle
+        with self._operation_lock:
+            entry = self._operation_callbacks.get(correlation_id)
+            if entry is not None:
+                self._store_operation_callback(reply['handle'], entry)
+
+    def _register_operation_callback(self, key, entry):
+        """
+        Store the callback and completion future for an operation's updates by
+        correlation id or handle and forget any that have expired.
+
         """
         with self._operation_lock:
-            self._request_queue.put({
-                'operation': query_name,
-                'parameters': parameters,
-            })
-            reply = self._reply_queue.get()
-        if reply.get('error') is not None:
-            raise RobotError(reply['error'])
-        return reply.get('data', {})
-
-    def run_operation(self, operation, callback=None, **parameters):
+            self._store_operation_callback(key, entry)
+
+    def _store_operation_callback(self, key, entry):
+        """Store a callback entry. Call with ``_operation_lock`` held."""
+        self._operation_callbacks[key] = entry
+        if self.operation_callback_timeout is None:
+            return
+        now = time.monotonic()
+        self._operation_expiry[key] = now + self.operation_callback_timeout
+        while self._operation_expiry:
+            key, expiry = next(iter(self._operation_expiry.items()))
+            if expiry > now:
+                break
+            del self._operation_expiry[key]
+            self._operation_callbacks.pop(key, None)
+
+    def start_operation(self, operation, callback=None, priority=None,
+                        deadline=None, **parameters):
+        """Start an operation and return a future for its completion.
+
+        Takes the same arguments as ``submit_operation``.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the message from the
+            operation's ``'end'`` update. Raises ``RobotError`` if the operation
+            failed or ``ValueError`` for an invalid operation name or
+            parameters.
+
+        """
+        completion = Future()
+
+        def on_reply(future):
+            if future.exception() is not None:
+                completion.set_exception(future.exception())
+
+        self._submit_operation(operation, parameters, callback, priority, deadline,
+                               completion).add_done_callback(on_reply)
+        return completion
+
+    def run_operation(self, operation, callback=None, priority=None,
+                      deadline=None, **parameters):
         """Run an operation on the ``RobotServer``.
 
         Args:
@@ -148,26 +552,107 @@ class RobotClient:
             callback: Callback function to receive updates about the operation.
                 Should handle arguments:
                 ``handle``, ``stage``, ``message``, ``error``
+            priority (int): Foreground queue priority.
+            deadline (float): Seconds to wait in the foreground queue.
 
         Raises:
             ValueError: Invalid operation name or parameters.
 
         """
-        with self._operation_lock:
-            self._request_queue.put({'operation': operation,
-                                     'parameters': parameters})
-            reply = self._reply_queue.get()
-            if reply.get('error') is not None:
-                raise ValueError(reply['error'])  # Invalid operation or parameters
-            if callback:
-                handle = reply['handle']
-                self._operation_callbacks[handle] = callback
-            return reply
+        return self.submit_operation(operation, callback, priority, deadline,
+                                     **parameters).result()
+
+    def submit_batch(self, requests):
+        """Send several queries and operations to the server in one request.
+
+        Args:
+            requests: List of dictionaries with the ``operation`` name and its
+                ``parameters``. Operations may also have a ``callback`` to
+                receive their updates, a ``priority`` and a ``deadline``.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the list of replies in the
+            same order as ``requests``. Query replies have the ``data`` and
+            operation replies have the ``handle``. Each has an ``error`` that
+            is ``None`` if the request succeeded.
+
+        """
+        callbacks = [request.get('callback') for request in requests]
+        requests = [{key: value for key, value in request.items()
+                     if key != 'callback'} for request in requests]
+        correlation_ids = [self._prepare_operation_request(request, callback)
+                           for request, callback in zip(requests, callbacks)]
+
+        def handle_reply(reply):
+            error = reply.get('error')
+            replies = (reply.get('data') or []) if error is None else []
+            for index, correlation_id in enumerate(correlation_ids):
+                if index < len(replies):
+                    request_reply = replies[index]
+                else:
+                    request_reply = {'error': error or 'no reply'}
+                self._handle_operation_reply(request_reply, correlation_id)
+            if error is not None:
+                raise RobotError(error)
+            return replies
+        return self._submit({'operation': 'batch',
+                             'parameters': {'requests': requests}}, handle_reply)
+
+    def run_batch(self, requests):
+        """Run several queries and operations in one round trip to the server.
+
+        See ``submit_batch`` for the format of ``requests`` and the replies.
+
+        Raises:
+            RobotError: The batch couldn't be processed.
+
+        """
+        return self.submit_batch(requests).result()
+
+    def cancel(self, handle):
+        """
+        Remove an operation from the server's foreground queue.
+
+        Args:
+            handle (int): Operation handle.
+
+        Raises:
+            RobotError: The operation isn't queued.
+
+        """
+        return self.run_query('cancel', handle=handle)
 
     def refresh(self):
         data = self.run_query('refresh')
         self.__dict__.update(data)
 
+    def sync(self):
+        """
+        Fetch the robot state along with its sequence number. Value updates
+        received before the state are applied only if they are newer.
+
+        Value callbacks are run for attributes whose value changed.
+
+        """
+        self._sync(notify=True)
+
+    def _sync(self, notify):
+        """Fetch the robot state, running value callbacks if ``notify``."""
+        state = self.run_query('sync')
+        with self._sequence_lock:
+            self._sequence = state['sequence']
+            if notify:
+                changed = {attr: value for attr, value in state['data'].items()
+                           if _changed(self.__dict__.get(attr, _MISSING), value)}
+            else:
+                self.__dict__.update(state['data'])
+            unsynced = list(self._unsynced_values)
+            self._unsynced_values.clear()
+        if notify:
+            self._handle_values(changed)
+        for message in unsynced:
+            self._handle_sequenced_values(message)
+
     def clear(self, level, callback=None):
         """
         Clear the robot state.
@@ -178,3 +663,29 @@ class RobotClient:
 
         """
         return self.run_operation('clear', level=level, callback=callback)
+
+
+_MISSING = object()
+
+
+def _changed(old, new):
+    """Compare attribute values, treating arrays as changed."""
+    try:
+        return bool(old != new)
+    except ValueError:  # Comparing arrays is ambiguous
+        return True
+
+
+def _complete(completion, message):
+    """Resolve an operation's completion future from its ``'end'`` update."""
+    if completion.done():
+        return
+    if message.get('error') is not None:
+        completion.set_exception(RobotError(message['error']))
+    else:
+        completion.set_result(message.get('message'))
+
+
+def _call_all(callbacks, value):
+    for callback in callbacks:
+        callback(value)
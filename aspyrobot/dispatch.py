@@ -0,0 +1,123 @@
+"""
+Dispatchers deliver ``RobotClient`` callbacks on another thread, such as the
+thread running a GUI event loop.
+
+Callbacks posted while a delivery is pending are batched and delivered
+together by one call to ``flush``. Value callbacks for the same attribute are
+coalesced so only the newest value is delivered. Operation callbacks are
+always delivered, in order.
+
+Example::
+
+    client = RobotClient(dispatcher=QtDispatcher())
+
+"""
+from collections import OrderedDict
+from queue import Queue
+from threading import Lock
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher:
+    """
+    Base class for dispatchers. Subclasses implement ``_schedule`` to arrange
+    for ``flush`` to be called on the target thread.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._pending = OrderedDict()
+
+    def post(self, key, func, *args, **kwargs):
+        """Queue a call to ``func`` for the next ``flush``.
+
+        Args:
+            key: Calls with the same key replace a pending call, keeping its
+                place in the batch. ``None`` to never replace.
+
+        """
+        if key is None:
+            key = object()
+        with self._lock:
+            schedule = not self._pending
+            self._pending[key] = (func, args, kwargs)
+        if schedule:
+            self._schedule()
+
+    def flush(self):
+        """Run every pending call. Must be called on the target thread."""
+        with self._lock:
+            pending, self._pending = self._pending, OrderedDict()
+        for func, args, kwargs in pending.values():
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception('error in callback %r', func)
+
+    def _schedule(self):
+        raise NotImplementedError
+
+
+class QueueDispatcher(Dispatcher):
+    """
+    Put ``flush`` on a ``queue.Queue`` for another thread to call.
+
+    Args:
+        queue: Queue to use. Any item taken from the queue should be called.
+            Defaults to a new queue available as the ``queue`` attribute.
+
+    Example::
+
+        dispatcher = QueueDispatcher()
+        client = RobotClient(dispatcher=dispatcher)
+        while True:
+            dispatcher.queue.get()()
+
+    """
+    def __init__(self, queue=None):
+        super().__init__()
+        self.queue = queue if queue is not None else Queue()
+
+    def _schedule(self):
+        self.queue.put(self.flush)
+
+
+class AsyncioDispatcher(Dispatcher):
+    """
+    Deliver callbacks in an ``asyncio`` event loop.
+
+    Args:
+        loop: Event loop to deliver callbacks in. Defaults to the current
+            event loop.
+
+    """
+    def __init__(self, loop=None):
+        super().__init__()
+        self.loop = loop or asyncio.get_event_loop()
+
+    def _schedule(self):
+        self.loop.call_soon_threadsafe(self.flush)
+
+
+class QtDispatcher(Dispatcher):
+    """
+    Deliver callbacks in the Qt event loop. Must be created in the GUI
+    thread. Requires the ``PyQt5`` package.
+    """
+    def __init__(self):
+        super().__init__()
+        try:
+            from PyQt5.QtCore import QObject, Qt, pyqtSignal
+        except ImportError:
+            raise ImportError('QtDispatcher requires the PyQt5 package')
+
+        class Notifier(QObject):
+            flush_requested = pyqtSignal()
+
+        self._notifier = Notifier()
+        self._notifier.flush_requested.connect(self.flush, Qt.QueuedConnection)
+
+    def _schedule(self):
+        self._notifier.flush_requested.emit()
@@ -0,0 +1,90 @@
+from queue import Queue
+from threading import Lock, Semaphore
+import logging
+import time
+
+from epics.ca import CAThread
+
+
+class OperationExecutor:
+    """
+    A pool of ``CAThread`` workers that runs foreground and background operations
+    for ``RobotServer``.
+
+    Threads are started as needed up to ``max_workers`` and then reused, so
+    each thread only sets up its Channel Access context once. Operations
+    submitted while every thread is busy wait in a queue.
+
+    Args:
+        max_workers (int): Maximum number of operations running at once.
+        logger: A logging.Logger object.
+
+    """
+    def __init__(self, max_workers, logger=None):
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self.max_workers = max_workers
+        self.logger = logger or logging.getLogger(__name__)
+        self._queue = Queue()
+        self._idle = Semaphore(0)
+        self._threads = []
+        self._stats_lock = Lock()
+        self._started = 0
+        self._total_wait = 0.
+        self._max_wait = 0.
+        self._finished = 0
+        self._total_run_time = 0.
+        self._max_run_time = 0.
+
+    def submit(self, func, *args, **kwargs):
+        """Queue ``func(*args, **kwargs)`` to run on a worker thread."""
+        self._queue.put((time.monotonic(), func, args, kwargs))
+        if self._idle.acquire(False):
+            return
+        with self._stats_lock:
+            if len(self._threads) < self.max_workers:
+                thread = CAThread(target=self._worker, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def shutdown(self):
+        """Stop the worker threads once the queued operations have run."""
+        with self._stats_lock:
+            for _ in self._threads:
+                self._queue.put(None)
+
+    def stats(self):
+        """Return the worker count, queue waits and run times as a dictionary."""
+        with self._stats_lock:
+            return {
+                'workers': len(self._threads),
+                'queued': self._queue.qsize(),
+                'started': self._started,
+                'mean_queue_wait': self._total_wait / max(self._started, 1),
+                'max_queue_wait': self._max_wait,
+                'mean_run_time': self._total_run_time / max(self._finished, 1),
+                'max_run_time': self._max_run_time,
+            }
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            queued_time, func, args, kwargs = item
+            wait = time.monotonic() - queued_time
+            with self._stats_lock:
+                self._started += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            start_time = time.monotonic()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                self.logger.exception('operation %r failed', func)
+            run_time = time.monotonic() - start_time
+            with self._stats_lock:
+                self._finished += 1
+                self._total_run_time += run_time
+                self._max_run_time = max(self._max_run_time, run_time)
+            self._idle.release()
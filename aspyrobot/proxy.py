@@ -0,0 +1,131 @@
+import logging
+
+import zmq
+
+from .serialization import (get_codec, pack_message, unpack_message,
+                            message_topic)
+
+
+class Relay:
+    """
+    A Zero-MQ XSUB/XPUB proxy that subscribes once to a ``RobotServer`` update
+    socket and re-publishes every message to its own subscribers. Running
+    relays in a separate process keeps the server's publishing cost the same
+    no matter how many clients there are. Relays can be chained.
+
+    Args:
+        upstream_addr: Address of the ``RobotServer`` (or another relay) update
+            socket to subscribe to.
+        downstream_addr: Address to bind for clients to subscribe to.
+        codec: Message codec used by the ``RobotServer``.
+        context: Zero-MQ context. Must be shared with the server if using
+            ``inproc`` addresses.
+        logger: A logging.Logger object.
+
+    """
+    POLL_TIMEOUT = 100  # milliseconds
+
+    def __init__(self, upstream_addr, downstream_addr, codec='json', context=None,
+                 logger=None):
+        self.upstream_addr = upstream_addr
+        self.downstream_addr = downstream_addr
+        self.codec = get_codec(codec)
+        self.logger = logger or logging.getLogger(__name__)
+        self._zmq_context = context or zmq.Context.instance()
+        self._shutdown_requested = False
+        self._control_addr = 'inproc://aspyrobot-relay-control-%x' % id(self)
+
+    def run(self):
+        """Forward messages until ``shutdown`` is called."""
+        upstream = self._zmq_context.socket(zmq.XSUB)
+        upstream.connect(self.upstream_addr)
+        upstream.send(b'\x01')  # Subscribe to everything to fill the cache
+        downstream = self._zmq_context.socket(zmq.XPUB)
+        downstream.setsockopt(zmq.XPUB_VERBOSE, 1)  # Tell us about every subscriber
+        downstream.bind(self.downstream_addr)
+        control = self._zmq_context.socket(zmq.PULL)
+        control.bind(self._control_addr)
+        poller = zmq.Poller()
+        poller.register(upstream, zmq.POLLIN)
+        poller.register(downstream, zmq.POLLIN)
+        poller.register(control, zmq.POLLIN)
+        while not self._shutdown_requested:
+            events = dict(poller.poll(self.POLL_TIMEOUT))
+            if upstream in events:
+                self._forward(upstream.recv_multipart(copy=False), downstream)
+            if downstream in events:
+                self._handle_subscription(downstream.recv(), downstream)
+        control.close()
+        downstream.close()
+        upstream.close()
+
+    def shutdown(self):
+        """Request the proxy stops forwarding."""
+        self._shutdown_requested = True
+        socket = self._zmq_context.socket(zmq.PUSH)
+        socket.setsockopt(zmq.LINGER, 100)
+        socket.connect(self._control_addr)
+        try:
+            socket.send(b'shutdown', flags=zmq.NOBLOCK)
+        except zmq.Again:
+            pass  # Not running
+        socket.close()
+
+    def _forward(self, frames, downstream):
+        downstream.send_multipart(frames, copy=False)
+
+    def _handle_subscription(self, message, downstream):
+        """Called with each subscription message from downstream."""
+
+
+class LastValueCache(Relay):
+    """
+    A ``Relay`` that keeps the last value of every attribute. When a client
+    subscribes, the cached values matching its subscription are sent straight
+    away in one message so new clients don't need to request the robot state.
+
+    Replayed messages are stamped with the latest sequence number seen by the
+    cache and marked with ``'replay': True``. Values published whole or split
+    by attribute (see ``RobotServer`` ``split_values``) are both cached.
+
+    Args:
+        upstream_addr: Address of the ``RobotServer`` (or another relay) update
+            socket to subscribe to.
+        downstream_addr: Address to bind for clients to subscribe to.
+        codec: Message codec used by the ``RobotServer``.
+        context: Zero-MQ context. Must be shared with the server if using
+            ``inproc`` addresses.
+        logger: A logging.Logger object.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache = {}  # Attribute topic to latest value
+        self._sequence = 0
+
+    def _forward(self, frames, downstream):
+        if frames[0].bytes.startswith(message_topic('values')):
+            message = unpack_message(self.codec, frames[1:])
+            for attr, value in message.get('data', {}).items():
+                self._cache[message_topic('values', attr)] = (attr, value)
+            self._sequence = max(self._sequence, message.get('sequence') or 0)
+        downstream.send_multipart(frames, copy=False)
+
+    def _handle_subscription(self, message, downstream):
+        """Send cached values to a new subscriber."""
+        if not message or message[0] != 1:
+            return  # Unsubscribe
+        prefix = message[1:]
+        data = dict(value for topic, value in self._cache.items()
+                    if topic.startswith(prefix))
+        if not data:
+            return
+        self.logger.debug('replaying %d cached values for %r', len(data), prefix)
+        # Send on a topic the new subscription matches
+        topic = prefix
+        if not prefix.startswith(message_topic('values')):
+            topic = message_topic('values')
+        replay = {'type': 'values', 'data': data, 'sequence': self._sequence,
+                  'replay': True}
+        downstream.send_multipart([topic] + pack_message(self.codec, replay),
+                                  copy=False)
@@ -0,0 +1,120 @@
+from collections import deque
+from itertools import islice
+from threading import Condition
+from queue import Empty
+import time
+
+
+class PublishQueue:
+    """
+    A bounded queue of messages waiting to be published by ``RobotServer``.
+
+    It has the same ``put`` and ``get`` interface as ``queue.Queue`` but
+    ``put`` never blocks. When the queue is full, room is made for the new
+    message by discarding or merging values messages. Any other message, such
+    as an operation update, is never dropped even if it takes the queue over
+    ``maxsize``.
+
+    Args:
+        maxsize (int): Number of messages to hold before applying the policy.
+            ``None`` for no limit.
+        policy (str): ``'merge'`` folds the oldest values message into the next
+            values message so only superseded attribute values are lost.
+            ``'drop_oldest'`` discards the oldest values message.
+
+    Attributes:
+        dropped (int): Number of attribute values discarded.
+        max_depth (int): Largest number of messages that have been queued.
+
+    """
+    POLICIES = ('merge', 'drop_oldest')
+
+    def __init__(self, maxsize=None, policy='merge'):
+        if policy not in self.POLICIES:
+            raise ValueError('unknown publish queue policy: %r' % policy)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.max_depth = 0
+        self._queue = deque()
+        self._not_empty = Condition()
+
+    def qsize(self):
+        with self._not_empty:
+            return len(self._queue)
+
+    def empty(self):
+        return not self.qsize()
+
+    def put(self, message):
+        with self._not_empty:
+            if (self.maxsize and len(self._queue) >= self.maxsize and
+                    _is_values(message)):
+                message = self._make_room(message)
+                if message is None:
+                    return
+            self._queue.append(message)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        with self._not_empty:
+            if not block:
+                timeout = 0
+            if timeout is None:
+                self._not_empty.wait_for(lambda: self._queue)
+            else:
+                end_time = time.monotonic() + timeout
+                while not self._queue:
+                    remaining = end_time - time.monotonic()
+                    if remaining <= 0:
+                        raise Empty
+                    self._not_empty.wait(remaining)
+            return self._queue.popleft()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def stats(self):
+        """Return the queue depth and drop counters as a dictionary."""
+        with self._not_empty:
+            return {'depth': len(self._queue), 'max_depth': self.max_depth,
+                    'dropped': self.dropped}
+
+    def _make_room(self, message):
+        """Apply the policy to a full queue before adding a values message.
+
+        Returns the message to append or ``None`` if it was merged or dropped.
+
+        """
+        indexes = list(islice((index for index, queued in enumerate(self._queue)
+                               if _is_values(queued)), 2))
+        if not indexes:
+            # Only operation messages are queued, which can't be dropped
+            if self.policy == 'drop_oldest':
+                self.dropped += len(message.get('data', {}))
+                return None
+            return message
+        oldest = self._queue[indexes[0]]
+        del self._queue[indexes[0]]
+        if self.policy == 'drop_oldest':
+            self.dropped += len(oldest.get('data', {}))
+            return message
+        # The following values message moves down one place once the oldest is
+        # removed. Merge into it, or into the new message if there isn't one.
+        if len(indexes) > 1:
+            index = indexes[1] - 1
+            self._queue[index] = self._merge(oldest, self._queue[index])
+            return message
+        return self._merge(oldest, message)
+
+    def _merge(self, older, newer):
+        data = dict(older.get('data', {}))
+        newer_data = newer.get('data', {})
+        self.dropped += len(data.keys() & newer_data.keys())
+        data.update(newer_data)
+        return dict(newer, data=data)
+
+
+def _is_values(message):
+    return message is not None and message.get('type') == 'values'
@@ -0,0 +1,43 @@
+"""
+Command line entry point for running a ``Relay`` in its own process.
+
+Example::
+
+    aspyrobot-relay tcp://robot-server:2000 tcp://*:2100 --cache
+
+Clients then connect their ``update_addr`` to port 2100 of the relay host.
+Relays can subscribe to other relays to build a fan-out tree.
+"""
+import argparse
+import logging
+
+from .proxy import Relay, LastValueCache
+from .serialization import CODECS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='aspyrobot-relay',
+        description='Re-publish RobotServer updates to many subscribers.'
+    )
+    parser.add_argument('upstream', help='update address of the RobotServer '
+                                         'or relay to subscribe to')
+    parser.add_argument('downstream', help='address to bind for clients')
+    parser.add_argument('--codec', default='json', choices=sorted(CODECS),
+                        help='message codec used by the RobotServer')
+    parser.add_argument('--cache', action='store_true',
+                        help='send the latest values to new subscribers')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    relay_class = LastValueCache if args.cache else Relay
+    relay = relay_class(args.upstream, args.downstream, codec=args.codec)
+    relay.logger.info('relaying %s to %s', args.upstream, args.downstream)
+    try:
+        relay.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
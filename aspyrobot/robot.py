@@ -1,4 +1,4 @@
-from time import time
+from threading import Condition, Lock
 
 from epics import PV, poll
 
@@ -12,6 +12,11 @@ class Robot:
 
     Args:
         prefix (str): Prefix of the robot IOC PVs. Eg ``'SR03ID01:'``.
+        put_completion (bool): Confirm the IOC has processed task arguments and
+            background commands using put completion instead of waiting a fixed
+            ``DELAY_TO_PROCESS``. The fixed delay is still used if the put
+            doesn't complete within ``PUT_TIMEOUT``, and before reading the
+            result of a foreground task.
 
     """
     attrs = {
@@ -43,33 +48,104 @@ class Robot:
 
     DELAY_TO_PROCESS = 0.3
     TASK_TIMEOUT = 2.5
+    PUT_TIMEOUT = 1.0
 
-    def __init__(self, prefix):
+    def __init__(self, prefix, put_completion=False):
         self._prefix = prefix
+        self.put_completion = put_completion
+        # State cache kept up to date by PV monitors so snapshots don't need to
+        # read from the PVs.
+        self._state_lock = Lock()
+        self._state = dict.fromkeys(self.attrs)
+        self._stale = set(self.attrs)
+        self.state_sequence = 0
+        self._connected = set()
+        self._connection_condition = Condition(self._state_lock)
         for attr, suffix in self.attrs.items():
-            pv = PV(prefix + suffix, form='ctrl')
+            pv = PV(prefix + suffix, form='ctrl',
+                    connection_callback=self._on_connection_change)
+            pv.add_callback(self._update_state, attr=attr)
             setattr(self, attr, pv)
+        # Foreground state is tracked by a monitor so waiting for a task to start
+        # or finish doesn't need to poll the IOC.
+        self._foreground_condition = Condition()
+        self._foreground_done_value = None
+        self._foreground_busy_count = 0
+        self.foreground_done.add_callback(self._on_foreground_done)
+
+    def _on_foreground_done(self, value, **_):
+        """Monitor callback for the foreground done flag."""
+        with self._foreground_condition:
+            if value == 0 and self._foreground_done_value != 0:
+                self._foreground_busy_count += 1
+            self._foreground_done_value = value
+            self._foreground_condition.notify_all()
+
+    def _update_state(self, attr, value, char_value, type, **_):
+        """Monitor callback to store the latest value of an attribute."""
+        if 'string' in type or 'char' in type:
+            value = char_value
+        with self._state_lock:
+            self._state[attr] = value
+            self._stale.discard(attr)
+            self.state_sequence += 1
+
+    def _on_connection_change(self, pvname, conn, **_):
+        """Mark attributes stale while their PV is disconnected."""
+        attr = self.attrs_r[pvname[len(self._prefix):]]
+        with self._state_lock:
+            if conn:
+                # The monitor will deliver a fresh value on reconnection
+                self._connected.add(attr)
+                self._connection_condition.notify_all()
+                return
+            self._connected.discard(attr)
+            self._stale.add(attr)
+            self.state_sequence += 1
+
+    def connect(self, timeout=5.):
+        """Wait for the robot PVs to connect.
+
+        All PVs connect in parallel so the total wait is bounded by ``timeout``
+        no matter how many PVs are slow or missing.
+
+        Args:
+            timeout (float): Seconds to wait for all PVs.
+
+        Returns:
+            list: Attributes whose PVs failed to connect.
+
+        """
+        with self._connection_condition:
+            self._connection_condition.wait_for(
+                lambda: len(self._connected) == len(self.attrs), timeout
+            )
+            return sorted(set(self.attrs) - self._connected)
 
     def snapshot(self):
         """Capture the robot state to a dictionary.
 
-        Stores the value of each attribute PV to a dictionary. For string and
-        char type PVs the string representation is stored.
+        Returns a copy of the latest value of each attribute received from the
+        PV monitors. For string and char type PVs the string representation is
+        stored. Attributes that haven't received a value are ``None``. Use
+        ``stale_attrs`` to find attributes whose PVs are disconnected.
 
         Returns: dict
 
         """
-        data = {}
-        for attr in self.attrs:
-            pv = getattr(self, attr)
-            if 'string' in pv.type or 'char' in pv.type:
-                value = pv.char_value
-            else:
-                value = pv.value
-            data[attr] = value
-        return data
-
-    def run_task(self, name, args=''):
+        with self._state_lock:
+            return dict(self._state)
+
+    def stale_attrs(self):
+        """List attributes that are disconnected or haven't received a value.
+
+        Returns: list
+
+        """
+        with self._state_lock:
+            return sorted(self._stale)
+
+    def run_task(self, name, args='', timeout=None):
         """Execute a foreground task on the robot.
 
         Checks to see that the robot controller foreground thread is free
@@ -78,16 +154,19 @@ class Robot:
         Args:
             name (str): Robot controller task to run
             args (str): Argument string to supply to the controller
-            timeout (float): Seconds to wait for the task to being
+            timeout (float): Seconds to wait for the task to finish. Waits
+                indefinitely by default.
 
         """
         if not self.foreground_done.get():
             raise RobotError('busy')
-        self.task_args.put(args or '\0')
-        poll(self.DELAY_TO_PROCESS)
+        busy_count = self._foreground_busy_count
+        self._put_and_wait(self.task_args, args or '\0')
         self.generic_command.put(name)
-        self._wait_for_foreground_busy(self.TASK_TIMEOUT)
-        self._wait_for_foreground_free()
+        self._wait_for_foreground_busy(self.TASK_TIMEOUT, busy_count)
+        self._wait_for_foreground_free(timeout)
+        # Put completion on the command says nothing about the result PVs so
+        # always give the IOC time to update them
         poll(self.DELAY_TO_PROCESS)
         if self.foreground_error.get() != 0:
             message = self.foreground_error_message.get(as_string=True)
@@ -109,24 +188,41 @@ class Robot:
             args (str): Argument string to supply to the controller
 
         """
-        self.task_args.put(args or '\0')
-        poll(self.DELAY_TO_PROCESS)
-        self.generic_command.put(name)
+        self._put_and_wait(self.task_args, args or '\0')
+        self._put_and_wait(self.generic_command, name)
+
+    def _put_and_wait(self, pv, value):
+        """Write to a PV and wait for the IOC to process it."""
+        if self.put_completion:
+            status = pv.put(value, wait=True, timeout=self.PUT_TIMEOUT)
+            if status is not None and status > 0:
+                return
+        else:
+            pv.put(value)
         poll(self.DELAY_TO_PROCESS)
 
-    def _wait_for_foreground_busy(self, timeout):
-        """Wait for the foreground busy flag to be set."""
-        t0 = time()
-        while time() < t0 + timeout:
-            if self.foreground_done.get() == 0:
-                break
-            poll(.01)
-        else:
+    def _wait_for_foreground_busy(self, timeout, busy_count):
+        """Wait for the foreground busy flag to be set.
+
+        Args:
+            timeout (float): Seconds to wait.
+            busy_count (int): Value of ``_foreground_busy_count`` before the
+                task was started. Lets us detect tasks that have already
+                finished by the time we start waiting.
+
+        """
+        with self._foreground_condition:
+            started = self._foreground_condition.wait_for(
+                lambda: self._foreground_busy_count > busy_count, timeout
+            )
+        if not started:
             raise RobotError('operation failed to start')
 
-    def _wait_for_foreground_free(self):
+    def _wait_for_foreground_free(self, timeout=None):
         """Wait for the foreground busy flag to clear."""
-        while True:
-            if self.foreground_done.get() == 1:
-                break
-            poll(.01)
+        with self._foreground_condition:
+            finished = self._foreground_condition.wait_for(
+                lambda: self._foreground_done_value == 1, timeout
+            )
+        if not finished:
+            raise RobotError('operation timed out')
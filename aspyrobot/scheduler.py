@@ -0,0 +1,126 @@
+from threading import Condition
+import heapq
+import logging
+import time
+
+from epics.ca import CAThread
+
+
+class ForegroundScheduler:
+    """
+    Queue foreground operations and run them one at a time.
+
+    Used by ``RobotServer`` when created with ``foreground_queue=True``.
+    Operations are run in order of priority, then in the order they were
+    submitted. While an operation waits it is sent ``'queued'`` stage updates
+    with its position in the queue (starting at 1).
+
+    Args:
+        operation_update: Function to send operation updates, with the same
+            arguments as ``RobotServer.operation_update``.
+        logger: A logging.Logger object.
+        foreground_free: Function returning whether the robot foreground is
+            free, eg not running a task started from the pendant. The next
+            operation waits until it is, checking every ``POLL_INTERVAL``.
+
+    """
+    POLL_INTERVAL = .1
+
+    def __init__(self, operation_update, logger=None, foreground_free=None):
+        self.operation_update = operation_update
+        self.logger = logger or logging.getLogger(__name__)
+        self.foreground_free = foreground_free or (lambda: True)
+        self._condition = Condition()
+        self._heap = []
+        self._entries = {}
+        self._positions = {}
+        self._count = 0
+        self._thread = None
+        self._shutdown_requested = False
+
+    def submit(self, handle, operation, parameters, priority=0, deadline=None):
+        """Queue a foreground operation.
+
+        Args:
+            handle (int): Operation handle.
+            operation: Function to call with the handle and parameters.
+            parameters (dict): Keyword arguments for the operation.
+            priority (int): Operations with a higher priority run first.
+            deadline (float): Seconds from now after which the operation is
+                abandoned if it hasn't started.
+
+        """
+        expires = None if deadline is None else time.monotonic() + deadline
+        with self._condition:
+            self._count += 1
+            heapq.heappush(self._heap, (-priority, self._count, handle))
+            self._entries[handle] = (operation, parameters, expires)
+            self._send_positions()
+            if self._thread is None:
+                self._thread = CAThread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self, handle):
+        """Remove an operation from the queue.
+
+        Returns:
+            bool: ``False`` if the operation wasn't queued.
+
+        """
+        with self._condition:
+            if self._entries.pop(handle, None) is None:
+                return False
+            self._heap = [item for item in self._heap if item[2] != handle]
+            heapq.heapify(self._heap)
+            self._positions.pop(handle, None)
+            self._send_positions()
+        self.operation_update(handle, stage='end', error='cancelled')
+        return True
+
+    def queued(self):
+        """Return the queued operation handles in the order they will run."""
+        with self._condition:
+            return [handle for _, _, handle in sorted(self._heap)]
+
+    def shutdown(self):
+        """Stop running queued operations and end those still queued."""
+        with self._condition:
+            self._shutdown_requested = True
+            handles = [handle for _, _, handle in sorted(self._heap)]
+            self._heap = []
+            self._entries.clear()
+            self._positions.clear()
+            self._condition.notify()
+        for handle in handles:
+            self.operation_update(handle, stage='end', error='shutting down')
+
+    def _send_positions(self):
+        """Send a queued update to operations whose position has changed."""
+        for position, (_, _, handle) in enumerate(sorted(self._heap), 1):
+            if self._positions.get(handle) != position:
+                self._positions[handle] = position
+                self.operation_update(handle, stage='queued', message=position)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # The foreground can become free without a notification
+                while not (self._shutdown_requested or
+                           self._heap and self.foreground_free()):
+                    self._condition.wait(self.POLL_INTERVAL if self._heap else None)
+                if self._shutdown_requested:
+                    break
+                _, _, handle = heapq.heappop(self._heap)
+                operation, parameters, expires = self._entries.pop(handle)
+                self._positions.pop(handle, None)
+                self._send_positions()
+            if expires is not None and time.monotonic() > expires:
+                self.logger.warning('operation %d deadline expired', handle)
+                self.operation_update(handle, stage='end',
+                                      error='deadline expired')
+                continue
+            try:
+                operation(handle, **parameters)
+            except Exception:
+                self.logger.exception('foreground operation %d failed', handle)
@@ -0,0 +1,198 @@
+"""
+Codecs for encoding the messages sent between ``RobotServer`` and its
+clients. The server and clients must be configured with the same codec.
+"""
+import json
+
+import numpy as np
+
+
+class JsonCodec:
+    """Encode messages as JSON. This is the default codec."""
+    name = 'json'
+
+    def encode(self, message):
+        return json.dumps(message, default=_json_default).encode()
+
+    def decode(self, data):
+        return json.loads(bytes(data).decode())
+
+
+def _json_default(obj):
+    """Convert numpy values from ``PV.value`` to JSON compatible types."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+class MsgpackCodec:
+    """Encode messages with msgpack.
+
+    Numpy arrays are packed as raw buffers with their dtype and shape rather
+    than as lists. Requires the ``msgpack`` package.
+
+    """
+    name = 'msgpack'
+    NDARRAY_EXT = 1
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise ImportError('the msgpack codec requires the msgpack package')
+        self._msgpack = msgpack
+
+    def encode(self, message):
+        return self._msgpack.packb(message, default=self._default,
+                                   use_bin_type=True)
+
+    def decode(self, data):
+        return self._msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False)
+
+    def _default(self, obj):
+        if isinstance(obj, np.ndarray):
+            header = (obj.dtype.str, obj.shape, np.ascontiguousarray(obj).data)
+            return self._msgpack.ExtType(self.NDARRAY_EXT, self.encode(header))
+        if isinstance(obj, np.generic):
+            return obj.item()
+        raise TypeError('%r can not be serialized by msgpack' % obj)
+
+    def _ext_hook(self, code, data):
+        if code != self.NDARRAY_EXT:
+            return self._msgpack.ExtType(code, data)
+        dtype, shape, buffer = self.decode(data)
+        return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, MsgpackCodec)}
+
+
+def get_codec(codec):
+    """Return a codec instance given a codec or the name of one."""
+    if isinstance(codec, str):
+        try:
+            return CODECS[codec]()
+        except KeyError:
+            raise ValueError('unknown codec: %r' % codec)
+    return codec
+
+
+def pack_message(codec, message):
+    """Encode a message into a list of Zero-MQ frames.
+
+    Numpy arrays in the message ``data`` are not encoded by the codec. Their
+    location, dtype and shape are listed in the header frame and the array
+    buffers follow as separate frames so they can be sent with ``copy=False``.
+    Arrays in nested dictionaries are included, such as the state in a
+    ``sync`` reply or the replies to a ``batch``, but lists other than
+    ``data`` itself aren't searched.
+
+    """
+    data = message.get('data')
+    if not isinstance(data, (dict, list)):
+        return [codec.encode(message)]
+    arrays = []
+    data = _extract_arrays(data, arrays)
+    if not arrays:
+        return [codec.encode(message)]
+    buffers = []
+    array_info = []
+    for path, value in arrays:
+        value = np.ascontiguousarray(value)
+        # Arrays directly in data are located by key alone
+        key = path[0] if len(path) == 1 else path
+        array_info.append([key, value.dtype.str, value.shape])
+        buffers.append(value)
+    header = dict(message, data=data, arrays=array_info)
+    return [codec.encode(header)] + buffers
+
+
+def _extract_arrays(value, arrays, path=()):
+    """Replace numpy arrays in a dictionary or list, and the dictionaries
+    nested in it, with ``None``.
+
+    The arrays are appended to ``arrays`` along with their path of keys and
+    indexes. Containers holding arrays are copied, others are returned as is.
+
+    """
+    if isinstance(value, dict):
+        items = value.items()
+    else:
+        items = enumerate(value)
+    replaced = None
+    for key, item in items:
+        if isinstance(item, np.ndarray):
+            arrays.append((path + (key,), item))
+            stripped = None
+        elif isinstance(item, dict):
+            stripped = _extract_arrays(item, arrays, path + (key,))
+            if stripped is item:
+                continue
+        else:
+            continue
+        if replaced is None:
+            replaced = dict(value) if isinstance(value, dict) else list(value)
+        replaced[key] = stripped
+    return value if replaced is None else replaced
+
+
+def unpack_message(codec, frames):
+    """Decode a message from the frames created by ``pack_message``.
+
+    Arrays are rebuilt on top of the received frame buffers without copying.
+
+    """
+    message = codec.decode(memoryview(frames[0]))
+    array_info = message.pop('arrays', None)
+    if array_info:
+        for (key, dtype, shape), frame in zip(array_info, frames[1:]):
+            path = key if isinstance(key, list) else [key]
+            container = message['data']
+            for step in path[:-1]:
+                container = container[step]
+            container[path[-1]] = np.frombuffer(memoryview(frame),
+                                                dtype=dtype).reshape(shape)
+    return message
+
+
+def split_envelope(frames):
+    """Split routing frames up to the empty delimiter from the message frames."""
+    for index, frame in enumerate(frames):
+        if not len(memoryview(frame)):
+            return frames[:index + 1], frames[index + 1:]
+    return [], frames
+
+
+def message_topic(kind, name=''):
+    """Return the topic frame for a published message.
+
+    Topics look like ``b'values.status.'`` or ``b'operation.12.'``. The trailing
+    separator stops a subscription to ``values.task`` from also matching
+    ``values.task_args``.
+
+    """
+    if name == '':
+        return ('%s.' % kind).encode()
+    return ('%s.%s.' % (kind, name)).encode()
+
+
+def subscription_topics(attrs=None, operations=True):
+    """Return the topics to subscribe to for the given attributes and operations.
+
+    Args:
+        attrs: Attribute names to receive value updates for, or ``None`` for all.
+        operations: ``True`` for updates of all operations, ``False`` for none
+            or a list of operation handles.
+
+    """
+    if attrs is None:
+        topics = [message_topic('values')]
+    else:
+        topics = [message_topic('values', attr) for attr in attrs]
+    if operations is True:
+        topics.append(message_topic('operation'))
+    elif operations:
+        topics.extend(message_topic('operation', handle) for handle in operations)
+    return topics
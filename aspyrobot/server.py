@@ -1,16 +1,23 @@
-from threading import Lock
-from ast import literal_eval
+from threading import Lock, Thread
 import logging
 import inspect
 from functools import wraps
 import time
 from queue import Queue, Empty
 import traceback
+from collections import deque, OrderedDict
 
 import zmq
 from epics.ca import CAThread, withCA
 
 from .exceptions import RobotError
+from .proxy import LastValueCache
+from .queues import PublishQueue
+from .executor import OperationExecutor
+from .scheduler import ForegroundScheduler
+from .spel import parse_update, MAX_MESSAGE_LENGTH
+from .serialization import (get_codec, pack_message, unpack_message,
+                            message_topic)
 
 
 def foreground_operation(func):
@@ -77,6 +84,99 @@ def _safe_run_operation(server, func, *args, **kwargs):
     return data, error
 
 
+class _OperationSpec:
+    """The cached details of an operation method used to dispatch requests.
+
+    Building the signature is slow so it is only done once per method.
+    Parameters for methods with a plain signature are checked with set
+    operations instead of ``Signature.bind``.
+
+    """
+    def __init__(self, name, target):
+        self.name = name
+        self.type = target._operation_type
+        self.key = _dispatch_key(target)
+        self.doc = inspect.getdoc(target) or ''
+        try:
+            self.signature = inspect.signature(target)
+        except ValueError:
+            self.signature = None
+        parameters = []
+        if self.signature is not None:
+            parameters = list(self.signature.parameters.values())
+        positional = {inspect.Parameter.POSITIONAL_ONLY,
+                      inspect.Parameter.POSITIONAL_OR_KEYWORD}
+        # Plain signatures can be checked without Signature.bind. Operations
+        # other than queries must take the handle as their first argument.
+        self._simple = True
+        if self.type != 'query':
+            self._simple = bool(parameters) and parameters[0].kind in positional
+            parameters = parameters[1:]
+        var_keyword = inspect.Parameter.VAR_KEYWORD
+        self._simple = self._simple and all(
+            p.kind in {inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                       inspect.Parameter.KEYWORD_ONLY, var_keyword}
+            for p in parameters
+        )
+        self._var_keyword = any(p.kind == var_keyword for p in parameters)
+        self.parameters = [p.name for p in parameters if p.kind != var_keyword]
+        self.required = [p.name for p in parameters
+                         if p.kind != var_keyword and p.default is p.empty]
+        self._names = frozenset(self.parameters)
+        self._required = frozenset(self.required)
+
+    def accepts(self, parameters):
+        """Check the operation can be called with ``parameters``."""
+        if not isinstance(parameters, dict) or self.signature is None:
+            return False
+        if self._simple:
+            names = parameters.keys()
+            return (self._required <= names and
+                    (self._var_keyword or names <= self._names))
+        try:
+            if self.type == 'query':
+                self.signature.bind(**parameters)
+            else:
+                self.signature.bind(None, **parameters)  # Must accept a handle
+        except TypeError:
+            return False
+        return True
+
+    def describe(self):
+        return {'type': self.type, 'parameters': self.parameters,
+                'required': self.required, 'doc': self.doc.partition('\n')[0]}
+
+
+class _OperationHistory:
+    """The recent updates sent for an operation.
+
+    The ``'start'`` update is always kept. Only the newest ``maxlen`` updates
+    before and after it are kept, which always includes the ``'end'`` update.
+
+    """
+    def __init__(self, maxlen):
+        self._before_start = deque(maxlen=maxlen)  # Eg 'queued' updates
+        self._start = None
+        self._after_start = deque(maxlen=maxlen)
+
+    def append(self, update):
+        if update['stage'] == 'start':
+            self._start = update
+        elif self._start is None:
+            self._before_start.append(update)
+        else:
+            self._after_start.append(update)
+
+    def updates(self):
+        start = [] if self._start is None else [self._start]
+        return list(self._before_start) + start + list(self._after_start)
+
+
+def _dispatch_key(target):
+    """Identify the function behind a bound method to detect replaced methods."""
+    return getattr(target, '__func__', target)
+
+
 class RobotServer(object):
     """
     The ``RobotServer`` monitors the state of the robot and processes operation
@@ -91,38 +191,123 @@ class RobotServer(object):
             state updates to clients.
         request_addr: An address to create a Zero-MQ socket to receive operation
             requests from clients.
+        request_workers (int): Number of threads processing requests, so a slow
+            query from one client does not hold up the others. Requests from a
+            single client are processed one at a time and in order.
+        publish_interval (float): If set, value updates are merged and published
+            at most once per interval (in seconds), keeping only the newest value
+            of each attribute. Operation updates are always sent immediately.
+        codec: Message codec, ``'json'`` (default) or ``'msgpack'``. Clients
+            must use the same codec.
+        last_value_cache (bool): Publish through a ``LastValueCache`` so new
+            clients are sent the latest values as soon as they subscribe.
+        publish_queue_size (int): Number of messages ``publish_queue`` holds
+            before values messages are merged or dropped. ``None`` for no limit.
+            Operation updates are never dropped.
+        publish_queue_policy (str): ``'merge'`` (default) to merge queued values
+            messages keeping the newest value of each attribute or
+            ``'drop_oldest'`` to discard the oldest values message.
+        operation_workers (int): Maximum number of foreground and background
+            operations running at once. Further operations wait in a queue.
+            ``None`` to start a new thread for every operation.
+        foreground_queue (bool): Queue foreground operations that arrive while
+            another is running, or while the robot foreground is busy, instead
+            of rejecting them as busy. Requests may include a ``priority`` and
+            a ``deadline`` in seconds. Queued operations are sent ``'queued'``
+            updates with their position and can be removed with the ``cancel``
+            query.
+        split_values (bool): Publish each attribute of a values message on
+            its own ``values.<attr>`` topic so clients created with ``attrs``
+            only receive those attributes. ``False`` to publish each values
+            message whole on the ``values.`` topic, which costs one encode and
+            send per message rather than per attribute, and keeps the values
+            coalesced by ``publish_interval`` together. Clients filtering by
+            ``attrs`` receive no values in that case.
 
     """
+    POLL_TIMEOUT = 100  # milliseconds
+    CONNECTION_TIMEOUT = 5.
+    CHANGE_LOG_SIZE = 1000
+    MAX_UPDATE_LENGTH = MAX_MESSAGE_LENGTH
+    OPERATION_HISTORY_SIZE = 100
+    OPERATION_HISTORY_UPDATES = 50
+
     def __init__(self, robot, logger=None, update_addr='tcp://*:2000',
-                 request_addr='tcp://*:2001'):
+                 request_addr='tcp://*:2001', request_workers=4,
+                 publish_interval=None, codec='json', last_value_cache=False,
+                 publish_queue_size=10000, publish_queue_policy='merge',
+                 operation_workers=8, foreground_queue=False, split_values=True):
         self.robot = robot
         self.logger = logger or logging.getLogger(__name__)
         self.request_addr = request_addr
         self.update_addr = update_addr
+        self.request_workers = request_workers
+        self.publish_interval = publish_interval
+        self.codec = get_codec(codec)
+        self.split_values = split_values
+        self.last_value_cache = last_value_cache
+        self._last_value_cache = None
         self._zmq_context = zmq.Context()
-        self.publish_queue = Queue()
+        self.publish_queue = PublishQueue(publish_queue_size, publish_queue_policy)
+        self.operation_workers = operation_workers
+        self._operation_executor = None
+        if operation_workers is not None:
+            self._operation_executor = OperationExecutor(operation_workers,
+                                                         logger=self.logger)
+        self._foreground_scheduler = None
+        if foreground_queue:
+            self._foreground_scheduler = ForegroundScheduler(
+                self.operation_update, logger=self.logger,
+                foreground_free=lambda: bool(self.robot.foreground_done.value)
+            )
         self._foreground_lock = Lock()
         self._operation_handle = 0
+        self._operations = {}  # Operation name to _OperationSpec
+        self._robot_update_executor = OperationExecutor(1, logger=self.logger)
         self._handle_lock = Lock()
+        self._correlation_ids = {}
+        self._operation_history = OrderedDict()  # Handle to _OperationHistory
+        # Published values are numbered so clients can detect missed messages
+        # and catch up from the change log.
+        self._sequence = 0
+        self._change_log = deque(maxlen=self.CHANGE_LOG_SIZE)
+        self._change_log_lock = Lock()
         self._shutdown_requested = False
+        self._control_addr = 'inproc://aspyrobot-control-%x' % id(self)
+        self._reply_addr = 'inproc://aspyrobot-replies-%x' % id(self)
 
     @withCA
     def setup(self):
         """Set up the server.
 
-        Starts threads and registers for EPICS callbacks.
+        Starts threads and registers for EPICS callbacks. If some robot PVs fail
+        to connect within ``CONNECTION_TIMEOUT`` the server starts anyway and
+        their updates are sent once they connect.
 
         """
+        disconnected = self.robot.connect(self.CONNECTION_TIMEOUT)
+        if disconnected:
+            self.logger.warning('starting with disconnected robot attributes: %s',
+                                ', '.join(disconnected))
+        publisher_addr = self.update_addr
+        if self.last_value_cache:
+            publisher_addr = 'inproc://aspyrobot-publisher-%x' % id(self)
+            self._last_value_cache = LastValueCache(
+                publisher_addr, self.update_addr, codec=self.codec,
+                context=self._zmq_context, logger=self.logger
+            )
+            Thread(target=self._last_value_cache.run, daemon=True).start()
         self._publisher_thread = CAThread(target=self._publisher,
-                                          args=(self.update_addr,), daemon=True)
+                                          args=(publisher_addr,), daemon=True)
         self._publisher_thread.start()
         self._request_thread = CAThread(target=self._request_handler,
                                         args=(self.request_addr,), daemon=True)
         self._request_thread.start()
         for attr in self.robot.attrs:
             pv = getattr(self.robot, attr)
-            pv.add_callback(self._pv_callback)
-        self.robot.client_update.add_callback(self._on_robot_update)
+            pv.add_callback(self._pv_callback, with_ctrlvars=False)
+        self.robot.client_update.add_callback(self._on_robot_update,
+                                              with_ctrlvars=False)
         self.logger.debug('setup complete')
 
     def shutdown(self):
@@ -132,6 +317,22 @@ class RobotServer(object):
 
         """
         self._shutdown_requested = True
+        self.publish_queue.put(None)  # Wake the publisher
+        if self._last_value_cache is not None:
+            self._last_value_cache.shutdown()
+        if self._operation_executor is not None:
+            self._operation_executor.shutdown()
+        if self._foreground_scheduler is not None:
+            self._foreground_scheduler.shutdown()
+        self._robot_update_executor.shutdown()
+        socket = self._zmq_context.socket(zmq.PUSH)
+        socket.setsockopt(zmq.LINGER, 100)
+        socket.connect(self._control_addr)
+        try:
+            socket.send(b'shutdown', flags=zmq.NOBLOCK)
+        except zmq.Again:
+            pass  # Request handler isn't running
+        socket.close()
 
     def _pv_callback(self, pvname, value, char_value, type, **kwargs):
         """When robot PVs change send a value update to clients."""
@@ -145,29 +346,144 @@ class RobotServer(object):
         """Publish robot state updates to clients over Zero-MQ."""
         socket = self._zmq_context.socket(zmq.PUB)
         socket.bind(update_addr)
+        pending_values = {}
+        next_values_time = 0
         while not self._shutdown_requested:
+            timeout = .1
+            if pending_values:
+                timeout = max(0, next_values_time - time.monotonic())
             try:
-                message = self.publish_queue.get(timeout=.1)
+                message = self.publish_queue.get(timeout=timeout)
             except Empty:
-                continue
-            data = message.get('data', {})
-            if not (len(data) == 1 and 'time' in data):  # Don't log time messages
-                self.logger.debug('sending to client: %r', message)
-            socket.send_json(message)
+                message = None
+            if message is not None:
+                if self.publish_interval and message['type'] == 'values':
+                    pending_values.update(message.get('data', {}))
+                else:
+                    if pending_values:  # Keep values ordered before operations
+                        self._publish(socket, {'type': 'values',
+                                               'data': pending_values})
+                        pending_values = {}
+                    self._publish(socket, message)
+            if pending_values and time.monotonic() >= next_values_time:
+                self._publish(socket, {'type': 'values', 'data': pending_values})
+                pending_values = {}
+                next_values_time = time.monotonic() + self.publish_interval
         socket.close()
 
+    def _publish(self, socket, message):
+        """Send a message prefixed with a topic frame.
+
+        Values messages are given a sequence number and recorded in the change
+        log. With ``split_values`` they are split up so each attribute has its
+        own topic and sequence number. This lets clients subscribe to just the
+        attributes they need.
+
+        """
+        data = message.get('data', {})
+        if not (len(data) == 1 and 'time' in data):  # Don't log time messages
+            self.logger.debug('sending to client: %r', message)
+        if message['type'] != 'values':
+            topic = message_topic(message['type'], message.get('handle', ''))
+            frames = pack_message(self.codec, message)
+            socket.send_multipart([topic] + frames, copy=False)
+            return
+        if self.split_values:
+            updates = [(message_topic('values', attr), {attr: value})
+                       for attr, value in data.items()]
+        else:
+            updates = [(message_topic('values'), data)]
+        for topic, values in updates:
+            with self._change_log_lock:
+                self._sequence += 1
+                sequence = self._sequence
+                self._change_log.append((sequence, values))
+            frames = pack_message(self.codec, dict(message, data=values,
+                                                   sequence=sequence))
+            socket.send_multipart([topic] + frames, copy=False)
+
     def _request_handler(self, request_addr):
-        """Listen for operation requests from clients."""
-        socket = self._zmq_context.socket(zmq.REP)
+        """Listen for operation requests from clients.
+
+        Requests arrive on a ROUTER socket and are passed to a pool of worker
+        threads. Replies from the workers come back over an inproc socket and are
+        routed to the client that made the request.
+
+        """
+        socket = self._zmq_context.socket(zmq.ROUTER)
         socket.bind(request_addr)
+        replies = self._zmq_context.socket(zmq.PULL)
+        replies.bind(self._reply_addr)
+        control = self._zmq_context.socket(zmq.PULL)
+        control.bind(self._control_addr)
+        work_queue = Queue()
+        for _ in range(self.request_workers):
+            CAThread(target=self._request_worker, args=(work_queue,),
+                     daemon=True).start()
+        # Requests waiting on an earlier request from the same client. A client
+        # only ever has one request being processed so replies stay in order.
+        waiting = {}
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        poller.register(replies, zmq.POLLIN)
+        poller.register(control, zmq.POLLIN)
         while not self._shutdown_requested:
+            # Wake as soon as a request or shutdown message arrives. The timeout
+            # is a fallback in case the shutdown message is missed.
+            events = dict(poller.poll(self.POLL_TIMEOUT))
+            if replies in events:
+                frames = replies.recv_multipart(copy=False)
+                socket.send_multipart(frames, copy=False)
+                client = frames[0].bytes
+                client_waiting = waiting.get(client)
+                if client_waiting:
+                    work_queue.put(client_waiting.popleft())
+                else:
+                    waiting.pop(client, None)
+            if socket in events:
+                frames = socket.recv_multipart()
+                client = frames[0]
+                if len(frames) < 3 or frames[1] != b'':
+                    # Without the empty delimiter there is no way to send a
+                    # reply the client can read.
+                    self.logger.error('dropping request without delimiter: %r',
+                                      frames[1:])
+                    continue
+                request = (client, frames[2:])
+                if client in waiting:
+                    waiting[client].append(request)
+                else:
+                    waiting[client] = deque()
+                    work_queue.put(request)
+        for _ in range(self.request_workers):
+            work_queue.put(None)
+        control.close()
+        replies.close()
+        socket.close()
+
+    def _request_worker(self, queue):
+        """Process requests passed on by the request handler."""
+        socket = self._zmq_context.socket(zmq.PUSH)
+        socket.connect(self._reply_addr)
+        while True:
+            request = queue.get()
+            if request is None:
+                break
+            client, payload = request
             try:
-                message = socket.recv_json(flags=zmq.NOBLOCK)
-            except zmq.ZMQError:
-                time.sleep(.05)
-                continue
-            response = self._process_request(message)
-            socket.send_json(response)
+                message = unpack_message(self.codec, payload)
+            except Exception:
+                message = None
+            if isinstance(message, dict):
+                response = self._process_request(message)
+                if 'id' in message:
+                    # Lets clients with several requests in flight match replies
+                    response = dict(response, id=message['id'])
+            else:
+                self.logger.error('invalid request message: %r', payload)
+                response = {'error': 'invalid request: could not decode message'}
+            socket.send_multipart([client, b''] + pack_message(self.codec, response),
+                                  copy=False)
         socket.close()
 
     def _process_request(self, message):
@@ -180,40 +496,92 @@ class RobotServer(object):
         except (AttributeError, TypeError):
             self.logger.error('operation does not exist: %r', operation)
             return {'error': 'invalid request: operation does not exist'}
-        try:
-            operation_type = target._operation_type
-        except AttributeError:
+        spec = self._operation_spec(operation, target)
+        if spec is None:
             self.logger.error('%r must be declared an operation', operation)
             return {'error': 'invalid request: %r not an operation' % operation}
-        try:
-            sig = inspect.signature(target)
-            if operation_type == 'query':
-                sig.bind(**parameters)
-            else:
-                sig.bind(None, **parameters)  # Must accept a handle argument
-        except (ValueError, TypeError):
+        operation_type = spec.type
+        if not spec.accepts(parameters):
             self.logger.error('invalid arguments for operation %r: %r',
                               operation, parameters)
             return {'error': 'invalid request: incorrect arguments'}
         self.logger.debug('calling: %r with %r', operation, parameters)
         if operation_type == 'query':
             return target(**parameters)
+        elif (operation_type == 'foreground' and
+              self._foreground_scheduler is not None):
+            priority = message.get('priority') or 0
+            deadline = message.get('deadline')
+            if not (isinstance(priority, (int, float)) and
+                    isinstance(deadline, (int, float, type(None)))):
+                return {'error': 'invalid request: incorrect priority or deadline'}
+            handle = self._next_handle(message.get('correlation_id'))
+            self._foreground_scheduler.submit(handle, target, parameters,
+                                              priority=priority, deadline=deadline)
+            return self._operation_reply(handle, message)
         elif operation_type in {'foreground', 'background'}:
-            handle = self._next_handle()
-            thread = CAThread(target=target, args=(handle,),
-                              kwargs=parameters, daemon=True)
-            thread.start()
-            return {'error': None, 'handle': handle}
+            handle = self._next_handle(message.get('correlation_id'))
+            if self._operation_executor is not None:
+                self._operation_executor.submit(target, handle, **parameters)
+            else:
+                thread = CAThread(target=target, args=(handle,),
+                                  kwargs=parameters, daemon=True)
+                thread.start()
+            return self._operation_reply(handle, message)
         else:
             return {'error': 'invalid request: unknown operation type'}
 
-    def _next_handle(self):
-        """Generate a new operation handle in a thread safe way."""
+    def _operation_reply(self, handle, message):
+        """Reply to an operation request, echoing any correlation id.
+
+        The echo tells the client the operation updates will include the id.
+
+        """
+        reply = {'error': None, 'handle': handle}
+        if message.get('correlation_id') is not None:
+            reply['correlation_id'] = message['correlation_id']
+        return reply
+
+    def _operation_spec(self, name, target):
+        """Return the cached ``_OperationSpec`` for an operation method.
+
+        Returns ``None`` if ``target`` isn't an operation.
+
+        """
+        spec = self._operations.get(name)
+        if spec is not None and spec.key is _dispatch_key(target):
+            return spec
+        if not hasattr(target, '_operation_type'):
+            return None
+        spec = self._operations[name] = _OperationSpec(name, target)
+        return spec
+
+    def _next_handle(self, correlation_id=None):
+        """Generate a new operation handle in a thread safe way.
+
+        Args:
+            correlation_id: Optional id supplied by the client. It is included
+                in every update for the operation so the client can match
+                updates that arrive before the reply with the handle.
+
+        """
         with self._handle_lock:
             self._operation_handle += 1
+            if correlation_id is not None:
+                self._correlation_ids[self._operation_handle] = correlation_id
             return self._operation_handle
 
     def _on_robot_update(self, char_value, **_):
+        """Pass special update messages from SPEL to the update worker.
+
+        Handling happens on a single worker thread so slow ``update_`` methods
+        don't hold up other PV callbacks, and messages are handled in the
+        order they arrive.
+
+        """
+        self._robot_update_executor.submit(self._handle_robot_update, char_value)
+
+    def _handle_robot_update(self, char_value):
         """Handle special update messages from SPEL.
 
         These messages use Python dictionary literal syntax and contain a key
@@ -222,18 +590,20 @@ class RobotServer(object):
 
         """
         try:
-            message = literal_eval(char_value)
-        except SyntaxError:
-            return self.logger.error('Invalid update message: %r', char_value)
-        attr = message.pop('set')
-        try:
-            method = getattr(self, 'update_' + attr)
-        except AttributeError:
-            return self.logger.warning('Unhandled robot update: %r', char_value)
+            attr, message = parse_update(char_value, self.MAX_UPDATE_LENGTH)
+        except ValueError as e:
+            return self.logger.error('Invalid update message (%s): %.200r',
+                                     e, char_value)
+        method = getattr(self, 'update_' + attr, None)
+        if method is None:
+            return self.logger.warning('Unhandled robot update: %.200r',
+                                       char_value)
         try:
             method(**message)
         except TypeError:
             self.logger.error('Invalid method signature for update: %r', message)
+        except Exception:
+            self.logger.error(traceback.format_exc())
 
     def operation_update(self, handle, message='', stage='update', error=None):
         """Add an operation update to the queue to be sent clients.
@@ -245,13 +615,29 @@ class RobotServer(object):
             error (str): Error message.
 
         """
-        self.publish_queue.put({
+        update = {
             'type': 'operation',
             'stage': stage,
             'handle': handle,
             'message': message,
             'error': error,
-        })
+        }
+        with self._handle_lock:
+            if stage == 'end':
+                correlation_id = self._correlation_ids.pop(handle, None)
+            else:
+                correlation_id = self._correlation_ids.get(handle)
+            if correlation_id is not None:
+                update['correlation_id'] = correlation_id
+            history = self._operation_history.get(handle)
+            if history is None:
+                history = self._operation_history[handle] = _OperationHistory(
+                    self.OPERATION_HISTORY_UPDATES
+                )
+                while len(self._operation_history) > self.OPERATION_HISTORY_SIZE:
+                    self._operation_history.popitem(last=False)
+            history.append(update)
+        self.publish_queue.put(update)
 
     def values_update(self, update):
         """Add an robot attribute value update to the queue to be sent clients.
@@ -273,6 +659,115 @@ class RobotServer(object):
         """
         return self.robot.snapshot()
 
+    @query_operation
+    def sync(self):
+        """Query operation to fetch the robot state and its sequence number.
+
+        Value updates with a higher sequence number than the one returned are
+        newer than the state.
+
+        """
+        with self._change_log_lock:
+            sequence = self._sequence
+        reply = self.refresh()
+        if reply['error'] is not None:
+            raise RobotError(reply['error'])
+        return {'sequence': sequence, 'data': reply['data']}
+
+    @query_operation
+    def changes_since(self, sequence):
+        """Query operation to fetch the value updates after a sequence number.
+
+        Returns the latest value of each attribute that changed. Raises an
+        error if the changes are no longer in the change log, in which case
+        clients should ``sync`` instead.
+
+        """
+        with self._change_log_lock:
+            if sequence > self._sequence:
+                raise RobotError('sequence %d is in the future' % sequence)
+            oldest = self._change_log[0][0] if self._change_log else 1
+            if sequence < oldest - 1:
+                raise RobotError('sequence %d is no longer available' % sequence)
+            data = {}
+            for change_sequence, values in self._change_log:
+                if change_sequence > sequence:
+                    data.update(values)
+            return {'sequence': self._sequence, 'data': data}
+
+    @query_operation
+    def operation_messages(self, handle):
+        """Query operation to fetch the updates sent for a recent operation.
+
+        Lets clients recover updates published before they were listening.
+        Only the most recent ``OPERATION_HISTORY_SIZE`` operations are kept.
+        For each, the ``'start'`` update and the last
+        ``OPERATION_HISTORY_UPDATES`` updates before and after it are kept.
+
+        """
+        with self._handle_lock:
+            history = self._operation_history.get(handle)
+            if history is None:
+                raise RobotError('no messages for operation %r' % handle)
+            return history.updates()
+
+    @query_operation
+    def batch(self, requests):
+        """Query operation to process several requests in one round trip.
+
+        Each request is a dictionary with an ``operation`` and its
+        ``parameters``, like a normal request. Queries are run and other
+        operations are started in order. Returns the reply to each request.
+
+        """
+        if not isinstance(requests, list):
+            raise RobotError('batch requests must be a list')
+        replies = []
+        for request in requests:
+            if not isinstance(request, dict):
+                replies.append({'error': 'invalid request: not a dictionary'})
+            elif request.get('operation') == 'batch':
+                replies.append({'error': 'invalid request: nested batch'})
+            else:
+                replies.append(self._process_request(request))
+        return replies
+
+    @query_operation
+    def list_operations(self):
+        """Query operation to describe the operations clients can request."""
+        operations = {}
+        for name in dir(self):
+            if name.startswith('_'):
+                continue
+            spec = self._operation_spec(name, getattr(self, name))
+            if spec is not None:
+                operations[name] = spec.describe()
+        return operations
+
+    @query_operation
+    def cancel(self, handle):
+        """Query operation to remove a queued foreground operation."""
+        if (self._foreground_scheduler is None or
+                not self._foreground_scheduler.cancel(handle)):
+            raise RobotError('operation %r is not queued' % handle)
+
+    @query_operation
+    def publish_stats(self):
+        """Query operation to fetch the publish queue depth and drop counters."""
+        return self.publish_queue.stats()
+
+    @query_operation
+    def robot_update_stats(self):
+        """Query operation to fetch the SPEL update queue depth and latency."""
+        return self._robot_update_executor.stats()
+
+    @query_operation
+    def operation_stats(self):
+        """Query operation to fetch the operation worker count and queue waits."""
+        if self._operation_executor is None:
+            return {}
+        return self._operation_executor.stats()
+
     @background_operation
     def clear(self, handle, level):
         """
@@ -0,0 +1,79 @@
+"""
+Parsing of the update messages the SPEL application writes to the
+``CLIENTUPDATE_MON`` PV.
+
+Messages use Python dictionary literal syntax, eg
+``{'set': 'ports', 'value': [0, 1, 1], 'position': 'left'}``. Most are also
+valid JSON once the quotes and constants are translated, which ``json`` parses
+much faster than ``ast.literal_eval``. Anything else falls back to
+``ast.literal_eval``.
+"""
+from ast import literal_eval
+import json
+import re
+
+MAX_MESSAGE_LENGTH = 2 ** 20
+
+_TOKEN = re.compile(r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|\b(?:True|False|None)\b""")
+_CONSTANTS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+
+def _reject_constant(name):
+    raise ValueError('%s is not a valid literal' % name)
+
+
+# NaN and Infinity are valid JSON to the decoder but not Python literals
+_decode_json = json.JSONDecoder(parse_constant=_reject_constant).decode
+
+
+def _literal_eval(text):
+    try:
+        return literal_eval(text)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        raise ValueError('update message is not a valid literal')
+
+
+def _to_json(match):
+    token = match.group()
+    if token[0] == "'":
+        return '"%s"' % token[1:-1].replace("\\'", "'").replace('"', '\\"')
+    return _CONSTANTS.get(token, token)
+
+
+def parse_update(text, max_length=MAX_MESSAGE_LENGTH):
+    """Parse a SPEL update message.
+
+    Args:
+        text (str): The message.
+        max_length (int): Longest message to accept.
+
+    Returns:
+        tuple: The name of the attribute to set and a dictionary of the other
+        message values.
+
+    Raises:
+        ValueError: The message is too long, isn't a valid literal or isn't a
+            dictionary with a ``'set'`` key naming the attribute.
+
+    """
+    if not isinstance(text, str):
+        raise ValueError('update message is not a string')
+    if len(text) > max_length:
+        raise ValueError('update message is longer than %d characters' %
+                         max_length)
+    if '\\/' in text:
+        # JSON decodes '\/' as '/' where Python keeps the backslash
+        message = _literal_eval(text)
+    else:
+        try:
+            message = _decode_json(_TOKEN.sub(_to_json, text))
+        except (ValueError, RecursionError):
+            message = _literal_eval(text)
+    if not isinstance(message, dict):
+        raise ValueError('update message is not a dictionary')
+    attr = message.pop('set', None)
+    if not isinstance(attr, str):
+        raise ValueError("update message has no 'set' attribute name")
+    if not all(isinstance(key, str) for key in message):
+        raise ValueError('update message keys must be strings')
+    return attr, message
@@ -0,0 +1,64 @@
+"""Measure fetching several query results one at a time and as a batch.
+
+A GUI refreshing its view runs ``refresh`` plus a few custom queries. Compares
+running them one after another with ``run_query`` ("before") with a single
+``run_batch`` ("after").
+
+Usage::
+
+    python benchmarks/batch_queries.py [n_queries] [n_rounds]
+
+"""
+from types import MethodType
+import statistics
+import sys
+import time
+from unittest.mock import MagicMock
+
+from aspyrobot import RobotClient, RobotServer
+from aspyrobot.server import query_operation
+
+
+@query_operation
+def port_state(server, position):
+    return {'position': position, 'ports': [1] * 96}
+
+
+def main():
+    n_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    n_rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    robot = MagicMock()
+    robot.snapshot.return_value = {'status': 0, 'current_task': ''}
+    update_addr, request_addr = 'tcp://127.0.0.1:12100', 'tcp://127.0.0.1:12101'
+    server = RobotServer(robot, logger=MagicMock(), update_addr=update_addr,
+                         request_addr=request_addr)
+    server.port_state = MethodType(port_state, server)
+    server.setup()
+    client = RobotClient(update_addr=update_addr, request_addr=request_addr)
+    client.setup()
+    requests = [{'operation': 'refresh', 'parameters': {}}] + [
+        {'operation': 'port_state', 'parameters': {'position': i}}
+        for i in range(n_queries - 1)
+    ]
+
+    def one_at_a_time():
+        return [client.run_query(r['operation'], **r['parameters'])
+                for r in requests]
+
+    def batch():
+        return [reply['data'] for reply in client.run_batch(requests)]
+
+    assert one_at_a_time() == batch()
+    for name, fetch in [('before', one_at_a_time), ('after', batch)]:
+        timings = []
+        for _ in range(n_rounds):
+            t0 = time.perf_counter()
+            fetch()
+            timings.append((time.perf_counter() - t0) * 1000)
+        print('%-6s %d queries  mean %6.3f ms  median %6.3f ms' % (
+            name, n_queries, statistics.mean(timings), statistics.median(timings)))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
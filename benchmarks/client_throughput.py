@@ -0,0 +1,90 @@
+"""Measure query throughput of a single ``RobotClient`` shared by N callers.
+
+Compares the previous REQ socket client, which held a lock across each round
+trip, with the current DEALER based client where requests are pipelined.
+
+Usage::
+
+    python benchmarks/client_throughput.py [n_callers] [n_requests]
+
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from queue import Queue
+from threading import Thread, Lock
+import sys
+import time
+from unittest.mock import MagicMock
+
+import zmq
+
+from aspyrobot import RobotClient, RobotServer
+from aspyrobot.exceptions import RobotError
+
+
+class LegacyRobotClient(RobotClient):
+
+    def setup(self):
+        self._request_queue = Queue()
+        self._reply_queue = Queue()
+        self._legacy_lock = Lock()
+        Thread(target=self._legacy_request_monitor, daemon=True).start()
+
+    def _legacy_request_monitor(self):
+        socket = self._zmq_context.socket(zmq.REQ)
+        socket.connect(self._request_addr)
+        while True:
+            socket.send_json(self._request_queue.get())
+            self._reply_queue.put(socket.recv_json())
+
+    def run_query(self, query_name, **parameters):
+        with self._legacy_lock:
+            self._request_queue.put({'operation': query_name,
+                                     'parameters': parameters})
+            reply = self._reply_queue.get()
+        if reply.get('error') is not None:
+            raise RobotError(reply['error'])
+        return reply.get('data', {})
+
+
+def run_callers(client, n_callers, n_requests):
+    def caller():
+        for _ in range(n_requests):
+            client.run_query('refresh')
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(n_callers) as executor:
+        wait([executor.submit(caller) for _ in range(n_callers)])
+    return n_callers * n_requests / (time.perf_counter() - t0)
+
+
+def run_futures(client, n_callers, n_requests):
+    t0 = time.perf_counter()
+    futures = [client.submit_query('refresh')
+               for _ in range(n_callers * n_requests)]
+    wait(futures)
+    return len(futures) / (time.perf_counter() - t0)
+
+
+def main():
+    n_callers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    robot = MagicMock()
+    robot.snapshot.return_value = {'status': 0, 'current_task': ''}
+    server = RobotServer(robot, logger=MagicMock(),
+                         update_addr='tcp://127.0.0.1:12020',
+                         request_addr='tcp://127.0.0.1:12021')
+    server.setup()
+    kwargs = {'update_addr': 'tcp://127.0.0.1:12020',
+              'request_addr': 'tcp://127.0.0.1:12021'}
+    legacy = LegacyRobotClient(**kwargs)
+    legacy.setup()
+    client = RobotClient(**kwargs)
+    client.setup()
+    print('%d callers x %d requests' % (n_callers, n_requests))
+    print('before  %8.0f requests/s' % run_callers(legacy, n_callers, n_requests))
+    print('after   %8.0f requests/s' % run_callers(client, n_callers, n_requests))
+    print('futures %8.0f requests/s' % run_futures(client, n_callers, n_requests))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
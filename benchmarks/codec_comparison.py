@@ -0,0 +1,66 @@
+"""Compare message size and encode/decode time of the message codecs.
+
+Uses a ``refresh`` reply with a realistic ``Robot.snapshot()`` payload, a
+single attribute values message and a snapshot containing a waveform.
+
+Usage::
+
+    python benchmarks/codec_comparison.py [n_iterations]
+
+"""
+import sys
+import timeit
+
+import numpy as np
+
+from aspyrobot.serialization import CODECS
+
+SNAPSHOT = {
+    'status': 0,
+    'current_task': 'MountSamplePort',
+    'task_args': 'l A 12',
+    'task_message': 'moving to dewar',
+    'task_progress': '3 of 8',
+    'task_result': 'normal 0',
+    'model': 'G6-553S-II',
+    'at_home': 0,
+    'motors_on': 1,
+    'motors_on_command': 1,
+    'toolset': 4,
+    'toolset_command': 4,
+    'foreground_done': 0,
+    'system_error_message': '',
+    'foreground_error': 0,
+    'foreground_error_message': '',
+    'safety_gate': 1,
+    'generic_command': 'MountSamplePort',
+    'generic_float_command': np.float64(0.0),
+    'generic_string_command': '',
+    'client_update': "{'set': 'port_states', 'position': 'left', "
+                     "'value': [1, 1, 0, 1, 0, 0, 1, 1, 0, 1, 1, 1, 0, 1, 1, 0]}",
+    'client_response': '',
+    'closest_point': np.int16(12),
+}
+PAYLOADS = {
+    'refresh reply': {'error': None, 'data': SNAPSHOT, 'id': 1},
+    'values update': {'type': 'values', 'data': {'task_progress': '4 of 8'}},
+    'waveform': {'type': 'values',
+                 'data': {'trajectory': np.random.random(2048)}},
+}
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for payload_name, payload in PAYLOADS.items():
+        print(payload_name)
+        for codec_name, codec_class in CODECS.items():
+            codec = codec_class()
+            data = codec.encode(payload)
+            encode = timeit.timeit(lambda: codec.encode(payload), number=n)
+            decode = timeit.timeit(lambda: codec.decode(data), number=n)
+            print('  %-8s %7d bytes  encode %7.2f us  decode %7.2f us' % (
+                codec_name, len(data), encode / n * 1e6, decode / n * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Measure the per-request cost of ``RobotServer._process_request``.
+
+Dispatches a trivial query and a background operation request directly,
+without any sockets, comparing the previous lookup that built an
+``inspect.Signature`` for every request ("before") with the cached operation
+specs ("after"). Background operations are submitted to a stub executor so
+only the dispatch is timed.
+
+Usage::
+
+    python benchmarks/dispatch_overhead.py [n_requests]
+
+"""
+import inspect
+import logging
+import sys
+import time
+from unittest.mock import MagicMock
+
+from aspyrobot import RobotServer
+from aspyrobot.server import query_operation, background_operation
+
+
+class BenchServer(RobotServer):
+
+    @query_operation
+    def ping(self, value=None):
+        return value
+
+    @background_operation
+    def set_variable(self, handle, name, value):
+        pass
+
+
+class LegacyServer(BenchServer):
+
+    def _process_request(self, message):
+        self.logger.debug('client request: %r', message)
+        operation = message.get('operation')
+        parameters = message.get('parameters', {})
+        try:
+            target = getattr(self, operation)
+        except (AttributeError, TypeError):
+            return {'error': 'invalid request: operation does not exist'}
+        try:
+            operation_type = target._operation_type
+        except AttributeError:
+            return {'error': 'invalid request: %r not an operation' % operation}
+        try:
+            sig = inspect.signature(target)
+            if operation_type == 'query':
+                sig.bind(**parameters)
+            else:
+                sig.bind(None, **parameters)
+        except (ValueError, TypeError):
+            return {'error': 'invalid request: incorrect arguments'}
+        self.logger.debug('calling: %r with %r', operation, parameters)
+        if operation_type == 'query':
+            return target(**parameters)
+        handle = self._next_handle()
+        self._operation_executor.submit(target, handle, **parameters)
+        return {'error': None, 'handle': handle}
+
+
+class StubExecutor:
+
+    def submit(self, func, *args, **kwargs):
+        pass
+
+
+def measure(server_class, message, n_requests):
+    server = server_class(MagicMock(), logger=logging.getLogger('bench'))
+    server._operation_executor = StubExecutor()
+    server._process_request(message)
+    t0 = time.perf_counter()
+    for _ in range(n_requests):
+        server._process_request(message)
+    return (time.perf_counter() - t0) / n_requests
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    messages = [
+        ('query', {'operation': 'ping', 'parameters': {'value': 1}}),
+        ('background', {'operation': 'set_variable',
+                        'parameters': {'name': 'x', 'value': 1}}),
+    ]
+    for label, message in messages:
+        for name, server_class in [('before', LegacyServer),
+                                   ('after', BenchServer)]:
+            per_request = measure(server_class, message, n_requests)
+            print('%-10s %-6s %6.2f us per request' % (label, name,
+                                                       per_request * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Measure thread churn and latency for a burst of background operations.
+
+Submits a burst of requests for a background operation that takes about a
+millisecond, like a ``clear`` or a SPEL variable update, and waits for every
+operation's ``'end'`` update. Compares a thread per operation ("before") with
+the ``OperationExecutor`` pool ("after").
+
+Usage::
+
+    python benchmarks/operation_burst.py [n_operations] [operation_workers]
+
+"""
+from types import MethodType
+import sys
+import threading
+import time
+from unittest.mock import MagicMock
+
+from epics import ca
+
+from aspyrobot import RobotServer
+from aspyrobot.server import background_operation
+
+
+operation_threads = set()
+
+
+@background_operation
+def update_variable(server, handle, value):
+    operation_threads.add(threading.current_thread())
+    time.sleep(.001)
+    return value
+
+
+def measure(operation_workers, n_operations):
+    server = RobotServer(MagicMock(), logger=MagicMock(),
+                         operation_workers=operation_workers)
+    server.update_variable = MethodType(update_variable, server)
+    operation_threads.clear()
+    submitted = {}
+    latencies = []
+    t0 = time.perf_counter()
+    for i in range(n_operations):
+        reply = server._process_request({'operation': 'update_variable',
+                                         'parameters': {'value': i}})
+        submitted[reply['handle']] = time.perf_counter()
+    while len(latencies) < n_operations:
+        message = server.publish_queue.get()
+        if message['type'] == 'operation' and message['stage'] == 'end':
+            latencies.append(time.perf_counter() - submitted[message['handle']])
+    elapsed = time.perf_counter() - t0
+    stats = server.operation_stats()['data']
+    server.shutdown()
+    latencies.sort()
+    return elapsed, len(operation_threads), latencies, stats
+
+
+def main():
+    n_operations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    ca.initialize_libca()  # Normally done by RobotServer.setup
+    for name, operation_workers in [('before', None), ('after', workers)]:
+        elapsed, n_threads, latencies, stats = measure(operation_workers,
+                                                       n_operations)
+        print('%-6s %d operations in %.3f s  threads %4d  latency '
+              'median %.1f ms  p99 %.1f ms  max queue wait %.1f ms' % (
+                  name, n_operations, elapsed, n_threads,
+                  latencies[len(latencies) // 2] * 1e3,
+                  latencies[int(len(latencies) * .99)] * 1e3,
+                  stats.get('max_queue_wait', 0) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
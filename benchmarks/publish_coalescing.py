@@ -0,0 +1,81 @@
+"""Count published messages and CPU time during a PV update storm.
+
+Simulates fast changing PVs by calling ``RobotServer._pv_callback`` at a high
+rate while a subscriber decodes every message, with and without a
+``publish_interval``. With an interval, values are published both split into
+one message per attribute and as one message per window (``split_values``).
+
+Usage::
+
+    python benchmarks/publish_coalescing.py [n_updates] [publish_interval]
+
+"""
+from threading import Thread
+import json
+import sys
+import time
+from unittest.mock import MagicMock
+
+import zmq
+
+from aspyrobot import Robot, RobotServer
+
+
+def measure(publish_interval, split_values, port, n_updates):
+    robot = MagicMock(_prefix='BENCH:', attrs_r=Robot.attrs_r)
+    addr = 'tcp://127.0.0.1:%d' % port
+    server = RobotServer(robot, logger=MagicMock(), update_addr=addr,
+                         request_addr='tcp://127.0.0.1:%d' % (port + 1),
+                         publish_interval=publish_interval,
+                         split_values=split_values)
+    server.setup()
+    subscriber = server._zmq_context.socket(zmq.SUB)
+    subscriber.setsockopt(zmq.SUBSCRIBE, b'')
+    subscriber.setsockopt(zmq.RCVTIMEO, 500)
+    subscriber.connect(addr)
+    time.sleep(.2)
+    received = []
+
+    def receive():
+        try:
+            while True:
+                topic, payload = subscriber.recv_multipart()
+                received.append(json.loads(payload.decode()))
+        except zmq.Again:
+            pass
+
+    thread = Thread(target=receive)
+    thread.start()
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    for i in range(n_updates):
+        suffix = 'TASKPROG_MON' if i % 2 else 'CLOSESTP_MON'
+        server._pv_callback(pvname='BENCH:' + suffix, value=i, char_value=str(i),
+                            type='ctrl_double')
+        if i % 100 == 0:
+            time.sleep(.001)  # Spread the updates out like a monitor would
+    thread.join()
+    elapsed = time.perf_counter() - t0 - .5  # Subtract the receive timeout
+    cpu = time.process_time() - cpu0
+    server.shutdown()
+    subscriber.close()
+    last_values = {}
+    for message in received:
+        last_values.update(message['data'])
+    return len(received), cpu, elapsed, last_values
+
+
+def main():
+    n_updates = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else .05
+    runs = [('before', None, True, 12030),
+            ('split', interval, True, 12040),
+            ('whole', interval, False, 12050)]
+    for name, publish_interval, split_values, port in runs:
+        count, cpu, elapsed, last_values = measure(publish_interval, split_values,
+                                                   port, n_updates)
+        print('%-6s %6d messages  cpu %6.3f s  wall %6.3f s  final %r' % (
+            name, count, cpu, elapsed, last_values))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Measure the ``RobotServer`` publishing cost with hundreds of subscribers.
+
+Subscribers run in a separate process and subscribe to every topic like a
+``RobotClient``. They connect either straight to the server ("before") or to
+an ``aspyrobot-relay`` process subscribed to the server ("after"). Reports
+the CPU time used by the server process, including the Zero-MQ I/O thread,
+and the time until every subscriber has every message.
+
+Usage::
+
+    python benchmarks/relay_fanout.py [n_subscribers] [n_messages]
+
+"""
+import subprocess
+import sys
+import time
+from unittest.mock import MagicMock
+
+import zmq
+
+from aspyrobot import RobotServer
+
+
+def subscribe(addr, n_subscribers, n_messages):
+    context = zmq.Context(io_threads=4)
+    poller = zmq.Poller()
+    sockets = []
+    for _ in range(n_subscribers):
+        socket = context.socket(zmq.SUB)
+        socket.setsockopt(zmq.SUBSCRIBE, b'values.')
+        socket.setsockopt(zmq.SUBSCRIBE, b'operation.')
+        socket.connect(addr)
+        poller.register(socket, zmq.POLLIN)
+        sockets.append(socket)
+    print('ready', flush=True)
+    expected = n_subscribers * n_messages
+    received = 0
+    deadline = time.time() + 60
+    while received < expected and time.time() < deadline:
+        for socket, _ in poller.poll(1000):
+            while True:
+                try:
+                    socket.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                received += 1
+    print(received, flush=True)
+
+
+def measure(port, n_subscribers, n_messages, relay):
+    server = RobotServer(MagicMock(), logger=MagicMock(),
+                         update_addr='tcp://127.0.0.1:%d' % port,
+                         request_addr='tcp://127.0.0.1:%d' % (port + 1))
+    server.setup()
+    addr = 'tcp://127.0.0.1:%d' % port
+    processes = []
+    if relay:
+        downstream = 'tcp://127.0.0.1:%d' % (port + 2)
+        processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'aspyrobot.relay', addr, downstream]
+        ))
+        addr = downstream
+    subscribers = subprocess.Popen(
+        [sys.executable, __file__, 'subscribe', addr, str(n_subscribers),
+         str(n_messages)],
+        stdout=subprocess.PIPE, universal_newlines=True,
+    )
+    processes.append(subscribers)
+    subscribers.stdout.readline()  # ready
+    time.sleep(1)  # Let the subscriptions propagate
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    for i in range(n_messages):
+        server.values_update({'task_progress': i})
+    received = int(subscribers.stdout.readline())
+    elapsed = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    server.shutdown()
+    for process in processes:
+        process.terminate()
+        process.wait()
+    return received, cpu, elapsed
+
+
+def main():
+    n_subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    n_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    for name, relay, port in [('before', False, 12090), ('after', True, 12095)]:
+        received, cpu, elapsed = measure(port, n_subscribers, n_messages, relay)
+        print('%-6s %d subscribers  %8d received  server cpu %6.3f s  '
+              'wall %6.3f s' % (name, n_subscribers, received, cpu, elapsed))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['subscribe']:
+        subscribe(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        main()
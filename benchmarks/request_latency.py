@@ -0,0 +1,72 @@
+"""Measure the round trip time of ``RobotClient.run_query``.
+
+Compares the current poller based request handler with the previous
+implementation which polled the socket with ``NOBLOCK`` and slept for 50 ms
+when no request was waiting.
+
+Usage::
+
+    python benchmarks/request_latency.py [n_requests]
+
+"""
+import statistics
+import sys
+import time
+from unittest.mock import MagicMock
+
+import zmq
+
+from aspyrobot import RobotClient, RobotServer
+
+
+class LegacyRobotServer(RobotServer):
+
+    def _request_handler(self, request_addr):
+        socket = self._zmq_context.socket(zmq.REP)
+        socket.bind(request_addr)
+        while not self._shutdown_requested:
+            try:
+                message = socket.recv_json(flags=zmq.NOBLOCK)
+            except zmq.ZMQError:
+                time.sleep(.05)
+                continue
+            response = self._process_request(message)
+            socket.send_json(dict(response, id=message.get('id')))
+        socket.close()
+
+
+def measure(server_class, port, n_requests):
+    robot = MagicMock()
+    robot.snapshot.return_value = {'status': 0, 'current_task': ''}
+    update_addr = 'tcp://127.0.0.1:%d' % port
+    request_addr = 'tcp://127.0.0.1:%d' % (port + 1)
+    server = server_class(robot, logger=MagicMock(), update_addr=update_addr,
+                          request_addr=request_addr)
+    server.setup()
+    client = RobotClient(update_addr=update_addr, request_addr=request_addr)
+    client.setup()
+    timings = []
+    for _ in range(n_requests):
+        time.sleep(.01)  # Let the server go idle between requests
+        t0 = time.perf_counter()
+        client.run_query('refresh')
+        timings.append(time.perf_counter() - t0)
+    server.shutdown()
+    return timings
+
+
+def report(name, timings):
+    ms = sorted(t * 1000 for t in timings)
+    print('%-8s mean %7.3f ms  median %7.3f ms  p95 %7.3f ms  max %7.3f ms' % (
+        name, statistics.mean(ms), statistics.median(ms),
+        ms[int(len(ms) * .95) - 1], ms[-1]))
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    report('before', measure(LegacyRobotServer, 12000, n_requests))
+    report('after', measure(RobotServer, 12010, n_requests))
+
+
+if __name__ == '__main__':
+    main()
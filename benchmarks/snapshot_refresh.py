@@ -0,0 +1,120 @@
+"""Measure ``refresh`` latency when many clients connect at once.
+
+Starts a caproto soft IOC serving the robot PVs and compares the previous
+``Robot.snapshot()``, which read every PV on each call, with the monitor
+backed cache. Also times a single snapshot while one PV isn't served.
+Requires ``caproto``.
+
+Usage::
+
+    python benchmarks/snapshot_refresh.py [n_clients]
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import subprocess
+import sys
+import time
+from unittest.mock import MagicMock
+
+PREFIX = 'BENCH:SNAPSHOT:'
+
+
+def run_ioc():
+    from caproto.server import pvproperty, PVGroup, run
+    from aspyrobot.robot import Robot
+
+    body = {}
+    for suffix in Robot.attrs.values():
+        if suffix.endswith('_STATUS'):
+            body[suffix] = pvproperty(value=0)
+        else:
+            body[suffix] = pvproperty(value='', max_length=40)
+    group_class = type('FakeRobotIOC', (PVGroup,), body)
+    ioc = group_class(prefix=PREFIX)
+    run(ioc.pvdb, module_name='caproto.asyncio.server', interfaces=['127.0.0.1'])
+
+
+def legacy_snapshot(robot):
+    data = {}
+    for attr in robot.attrs:
+        pv = getattr(robot, attr)
+        if 'string' in pv.type or 'char' in pv.type:
+            value = pv.char_value
+        else:
+            value = pv.value
+        data[attr] = value
+    return data
+
+
+def measure(robot, n_clients, port):
+    from aspyrobot import RobotClient, RobotServer
+    kwargs = {'update_addr': 'tcp://127.0.0.1:%d' % port,
+              'request_addr': 'tcp://127.0.0.1:%d' % (port + 1)}
+    server = RobotServer(robot, logger=MagicMock(), **kwargs)
+    server.setup()
+    clients = [RobotClient(**kwargs) for _ in range(n_clients)]
+    client_setup_times = []
+
+    def connect(client):
+        t0 = time.perf_counter()
+        client.setup()
+        client_setup_times.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(n_clients) as executor:
+        list(executor.map(connect, clients))
+    total = time.perf_counter() - t0
+    server.shutdown()
+    return total, max(client_setup_times)
+
+
+def main():
+    if sys.argv[1:] == ['ioc']:
+        return run_ioc()
+    n_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    os.environ.update(EPICS_CA_AUTO_ADDR_LIST='NO', EPICS_CA_ADDR_LIST='127.0.0.1')
+    ioc = subprocess.Popen([sys.executable, __file__, 'ioc'],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    from aspyrobot.robot import Robot
+
+    class LegacyRobot(Robot):
+        snapshot = legacy_snapshot
+
+    def with_missing_pv(robot_class):
+        attrs = dict(robot_class.attrs, closest_point='MISSING_MON')
+        return type(robot_class.__name__, (robot_class,), {
+            'attrs': attrs, 'attrs_r': {v: k for k, v in attrs.items()},
+        })
+
+    try:
+        time.sleep(2)
+        legacy, robot = LegacyRobot(PREFIX), Robot(PREFIX)
+        time.sleep(1)
+        print('%d clients connecting at once' % n_clients)
+        for name, instance, port in [('before', legacy, 12050),
+                                     ('after', robot, 12060)]:
+            total, slowest = measure(instance, n_clients, port)
+            print('%-6s all connected in %.3f s, slowest client %.3f s' % (
+                name, total, slowest))
+        for name, instance in [('before', legacy), ('after', robot)]:
+            t0 = time.perf_counter()
+            for _ in range(1000):
+                instance.snapshot()
+            print('%-6s snapshot() %.1f us' % (
+                name, (time.perf_counter() - t0) * 1000))
+        print('single snapshot with one PV disconnected')
+        legacy = with_missing_pv(LegacyRobot)(PREFIX)
+        robot = with_missing_pv(Robot)(PREFIX)
+        time.sleep(1)
+        for name, instance in [('before', legacy), ('after', robot)]:
+            t0 = time.perf_counter()
+            instance.snapshot()
+            print('%-6s %.3f s' % (name, time.perf_counter() - t0))
+        print('stale attributes: %r' % robot.stale_attrs())
+    finally:
+        ioc.terminate()
+
+
+if __name__ == '__main__':
+    main()
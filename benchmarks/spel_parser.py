@@ -0,0 +1,56 @@
+"""Measure parsing of SPEL ``CLIENTUPDATE_MON`` messages.
+
+Compares ``ast.literal_eval`` ("before") with ``aspyrobot.spel.parse_update``
+("after") on realistic messages, from a small status update to the state of
+every port in a full dewar.
+
+Usage::
+
+    python benchmarks/spel_parser.py [n_repeats]
+
+"""
+from ast import literal_eval
+import sys
+import time
+
+from aspyrobot.spel import parse_update
+
+
+def port_states(n_pucks):
+    return repr({
+        'set': 'port_states',
+        'position': 'left',
+        'value': [[1, 0, -1, 1] * 4 for _ in range(n_pucks)],
+        'names': ['puck %s' % chr(65 + i % 26) for i in range(n_pucks)],
+        'distances': [[0.125 * i] * 16 for i in range(n_pucks)],
+        'complete': True,
+    })
+
+
+MESSAGES = [
+    ('status', "{'set': 'lid', 'value': 'open', 'error': None}"),
+    ('12 pucks', port_states(12)),
+    ('87 pucks', port_states(87)),
+]
+
+
+def measure(parse, text, n_repeats):
+    t0 = time.perf_counter()
+    for _ in range(n_repeats):
+        parse(text)
+    return (time.perf_counter() - t0) / n_repeats
+
+
+def main():
+    n_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for name, text in MESSAGES:
+        assert parse_update(text)[1] == {k: v for k, v in literal_eval(text).items()
+                                         if k != 'set'}
+        before = measure(literal_eval, text, n_repeats)
+        after = measure(parse_update, text, n_repeats)
+        print('%-12s %7d chars  before %8.1f us  after %8.1f us  (%.1fx)' % (
+            name, len(text), before * 1e6, after * 1e6, before / after))
+
+
+if __name__ == '__main__':
+    main()
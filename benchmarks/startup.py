@@ -0,0 +1,76 @@
+"""Measure robot startup time when part of the IOC is down.
+
+Starts a caproto soft IOC serving all but a few of the robot PVs. Compares
+connecting the PVs one after the other, each with its own timeout, with
+``Robot.connect()`` which waits for all PVs together under one timeout.
+Requires ``caproto``.
+
+Usage::
+
+    python benchmarks/startup.py [timeout]
+
+"""
+import os
+import subprocess
+import sys
+import time
+
+from epics import PV
+
+PREFIX = 'BENCH:STARTUP:'
+MISSING = {'CLOSESTP_MON', 'CLIENTRESP_MON', 'GENERICFLOAT_CMD'}
+
+
+def run_ioc():
+    from caproto.server import pvproperty, PVGroup, run
+    from aspyrobot.robot import Robot
+
+    body = {}
+    for suffix in Robot.attrs.values():
+        if suffix in MISSING:
+            continue
+        if suffix.endswith('_STATUS'):
+            body[suffix] = pvproperty(value=0)
+        else:
+            body[suffix] = pvproperty(value='', max_length=40)
+    ioc = type('FakeRobotIOC', (PVGroup,), body)(prefix=PREFIX)
+    run(ioc.pvdb, module_name='caproto.asyncio.server', interfaces=['127.0.0.1'])
+
+
+def sequential_connect(robot_class, timeout):
+    failed = []
+    for attr, suffix in robot_class.attrs.items():
+        pv = PV(PREFIX + suffix, form='ctrl')
+        if not pv.wait_for_connection(timeout):
+            failed.append(attr)
+    return sorted(failed)
+
+
+def main():
+    if sys.argv[1:] == ['ioc']:
+        return run_ioc()
+    timeout = float(sys.argv[1]) if len(sys.argv) > 1 else 1.
+    os.environ.update(EPICS_CA_AUTO_ADDR_LIST='NO', EPICS_CA_ADDR_LIST='127.0.0.1')
+    ioc = subprocess.Popen([sys.executable, __file__, 'ioc'],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    from aspyrobot.robot import Robot
+    try:
+        time.sleep(2)
+        print('%d of %d PVs missing, timeout %.1f s' % (
+            len(MISSING), len(Robot.attrs), timeout))
+        # Run the parallel connection first so it can't benefit from channels
+        # already created by the sequential run.
+        t0 = time.perf_counter()
+        failed = Robot(PREFIX).connect(timeout)
+        after = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        sequential_connect(Robot, timeout)
+        before = time.perf_counter() - t0
+        print('before %.3f s' % before)
+        print('after  %.3f s  failed %r' % (after, failed))
+    finally:
+        ioc.terminate()
+
+
+if __name__ == '__main__':
+    main()
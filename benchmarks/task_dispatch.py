@@ -0,0 +1,92 @@
+"""Measure the per-task overhead of ``Robot.run_task`` against a fake IOC.
+
+Starts a caproto soft IOC that pretends to be the robot: writing
+``GENERIC_CMD`` runs a fake foreground task that clears ``FDONE_STATUS`` for
+``TASK_TIME`` seconds. Compares the fixed ``DELAY_TO_PROCESS`` dispatch with
+put completion. Requires ``caproto``.
+
+Usage::
+
+    python benchmarks/task_dispatch.py [n_tasks]
+
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+PREFIX = 'BENCH:ROBOT:'
+TASK_TIME = .05
+ARGS_PROCESS_TIME = .02
+
+
+def run_ioc():
+    from caproto.server import PVGroup, pvproperty, run
+
+    class FakeRobotIOC(PVGroup):
+        RA_CMD = pvproperty(value='', max_length=40)
+        GENERIC_CMD = pvproperty(value='', max_length=40)
+        FDONE_STATUS = pvproperty(value=1)
+        FERR_STATUS = pvproperty(value=0)
+        FOREEMSG_MON = pvproperty(value='', max_length=40)
+        RRESULT_MON = pvproperty(value='ok done', max_length=40)
+
+        @RA_CMD.putter
+        async def RA_CMD(self, instance, value):
+            await asyncio.sleep(ARGS_PROCESS_TIME)  # Controller reads the args
+            return value
+
+        @GENERIC_CMD.putter
+        async def GENERIC_CMD(self, instance, value):
+            asyncio.get_event_loop().create_task(self.fake_task())
+            return value
+
+        async def fake_task(self):
+            await self.FDONE_STATUS.write(0)
+            await asyncio.sleep(TASK_TIME)
+            await self.FDONE_STATUS.write(1)
+
+    ioc = FakeRobotIOC(prefix=PREFIX)
+    run(ioc.pvdb, module_name='caproto.asyncio.server', interfaces=['127.0.0.1'])
+
+
+def measure(put_completion, n_tasks):
+    from aspyrobot import Robot
+    robot = Robot(PREFIX, put_completion=put_completion)
+    robot.foreground_done.wait_for_connection(5)
+    robot.task_args.wait_for_connection(5)
+    time.sleep(.5)
+    t0 = time.perf_counter()
+    for _ in range(n_tasks):
+        robot.run_task('FakeTask', 'l 0')
+    foreground = (time.perf_counter() - t0) / n_tasks
+    t0 = time.perf_counter()
+    for _ in range(n_tasks):
+        robot.run_background_task('FakeTask', 'l 0')
+    background = (time.perf_counter() - t0) / n_tasks
+    return foreground, background
+
+
+def main():
+    if sys.argv[1:] == ['ioc']:
+        return run_ioc()
+    n_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    os.environ.update(EPICS_CA_AUTO_ADDR_LIST='NO', EPICS_CA_ADDR_LIST='127.0.0.1')
+    ioc = subprocess.Popen([sys.executable, __file__, 'ioc'],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(2)
+        print('fake task time %.3f s, argument processing time %.3f s' % (
+            TASK_TIME, ARGS_PROCESS_TIME))
+        for name, put_completion in [('delay', False), ('put completion', True)]:
+            foreground, background = measure(put_completion, n_tasks)
+            print('%-15s run_task %.3f s (overhead %.3f s)  '
+                  'run_background_task %.3f s' % (
+                      name, foreground, foreground - TASK_TIME, background))
+    finally:
+        ioc.terminate()
+
+
+if __name__ == '__main__':
+    main()
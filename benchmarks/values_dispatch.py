@@ -0,0 +1,70 @@
+"""Measure the cost of applying a values message in ``RobotClient``.
+
+A GUI client typically has ``on_<attr>`` handlers for a few attributes, on the
+client or on its delegate. Compares the previous ``_handle_values``, which
+looked up the handlers for every value ("before"), with the cached callback
+table ("after").
+
+Usage::
+
+    python benchmarks/values_dispatch.py [n_messages]
+
+"""
+import sys
+import time
+
+from aspyrobot import RobotClient, Robot
+
+
+class Delegate:
+
+    def on_status(self, value):
+        pass
+
+    def on_task_progress(self, value):
+        pass
+
+
+class GuiClient(RobotClient):
+
+    def on_at_home(self, value):
+        pass
+
+    def on_task_message(self, value):
+        pass
+
+
+class LegacyGuiClient(GuiClient):
+
+    def _handle_values(self, values):
+        for attr, value in values.items():
+            setattr(self, attr, value)
+            callback = getattr(self, 'on_' + attr, None)
+            if callback is not None:
+                callback(value)
+            if self.delegate is not None:
+                callback = getattr(self.delegate, 'on_' + attr, None)
+                if callback is not None:
+                    callback(value)
+
+
+def measure(client_class, n_messages):
+    client = client_class()
+    client.delegate = Delegate()
+    attrs = sorted(Robot.attrs)
+    messages = [{attrs[i % len(attrs)]: i} for i in range(n_messages)]
+    t0 = time.perf_counter()
+    for values in messages:
+        client._handle_values(values)
+    return (time.perf_counter() - t0) / n_messages
+
+
+def main():
+    n_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for name, client_class in [('before', LegacyGuiClient), ('after', GuiClient)]:
+        per_message = measure(client_class, n_messages)
+        print('%-6s %6.3f us per message' % (name, per_message * 1e6))
+
+
+if __name__ == '__main__':
+    main()
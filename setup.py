@@ -13,8 +13,15 @@ setup(
     license='MIT',
     packages=['aspyrobot'],
     install_requires=[
-        'pyzmq>=15.1.0',
+        'pyzmq>=17.0.0',
         'pyepics>=3.2.5rc3',
         'numpy>=1.11.0',
     ],
+    extras_require={
+        'msgpack': ['msgpack>=0.5.2'],
+        'qt': ['PyQt5'],
+    },
+    entry_points={
+        'console_scripts': ['aspyrobot-relay = aspyrobot.relay:main'],
+    },
 )
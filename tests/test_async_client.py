@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+import zmq
+
+from aspyrobot.async_client import AsyncRobotClient
+from aspyrobot.exceptions import RobotError
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def client(loop):
+    return AsyncRobotClient()
+
+
+def test_handle_values_sets_attrs(client):
+    client._handle_values({'lid_open_status': 'open'})
+    assert client.lid_open_status == 'open'
+
+
+def test_updates_iterator(client, loop):
+    updates = client.updates()
+    client._handle_values({'at_home': 1})
+    client._handle_values({'at_home': 0})
+    assert loop.run_until_complete(updates.__anext__()) == {'at_home': 1}
+    assert loop.run_until_complete(updates.__anext__()) == {'at_home': 0}
+    updates.close()
+    assert client._update_queues == set()
+
+
+def test_wait_for_operation(client, loop):
+    async def wait_and_finish():
+        waiter = asyncio.ensure_future(client.wait_for_operation(1))
+        await asyncio.sleep(0)
+        client._handle_operation({'handle': 1, 'stage': 'end',
+                                  'message': 'done', 'error': None})
+        return await waiter
+    assert loop.run_until_complete(wait_and_finish()) == 'done'
+
+
+def test_wait_for_operation_already_finished(client, loop):
+    client._handle_operation({'handle': 1, 'stage': 'end',
+                              'message': None, 'error': 'bad bad happened'})
+    with pytest.raises(RobotError):
+        loop.run_until_complete(client.wait_for_operation(1))
+
+
+def test_updates_iterator_drops_oldest_when_full(client, loop):
+    client.UPDATE_QUEUE_SIZE = 2
+    updates = client.updates()
+    for value in range(3):
+        client._handle_values({'task_progress': value})
+    assert loop.run_until_complete(updates.__anext__()) == {'task_progress': 1}
+    assert loop.run_until_complete(updates.__anext__()) == {'task_progress': 2}
+
+
+def test_updates_context_manager_stops_updates(client, loop):
+    async def first_update():
+        async with client.updates() as updates:
+            client._handle_values({'at_home': 1})
+            async for values in updates:
+                return values
+    assert loop.run_until_complete(first_update()) == {'at_home': 1}
+    assert client._update_queues == set()
+
+
+def test_close_terms_context(client):
+    client._request_socket = client._zmq_context.socket(zmq.DEALER)
+    client._update_socket = client._zmq_context.socket(zmq.SUB)
+    client.close()
+    assert client._zmq_context.closed
@@ -1,46 +1,80 @@
 from unittest.mock import Mock, MagicMock, call
+import json
+import time
 
+import numpy as np
 import pytest
 
 from aspyrobot.client import RobotClient
+from aspyrobot.exceptions import RobotError
 
 
 @pytest.fixture
 def client():
-    return RobotClient()
+    client = RobotClient()
+    client._submit_socket = MagicMock()
+    return client
 
 
-def test_run_operation(client):
-    expected_response = {'error': None, 'handle': 1}
-    client._reply_queue.put(expected_response)
-    expected_request = {'operation': 'set_lid', 'parameters': {'value': 1}}
-    assert client.run_operation('set_lid', value=1) == expected_response
-    assert client._request_queue.get() == expected_request
+def reply(client, message):
+    mock_socket = MagicMock()
+    mock_socket.recv_multipart.return_value = [b'', json.dumps(message).encode()]
+    client._handle_reply(mock_socket)
 
 
-def test_handle_request(client):
-    mock_socket = MagicMock()
-    mock_socket.recv_json.return_value = {'error': None}
-    request = {'operation': 'probe'}
-    client._request_queue.put(request)
-    client._handle_request(mock_socket)
-    assert client._reply_queue.get() == {'error': None}
-    assert mock_socket.send_json.call_args == call(request)
+def test_submit_operation(client):
+    future = client.submit_operation('set_lid', value=1)
+    expected_request = {'operation': 'set_lid', 'parameters': {'value': 1}, 'id': 1}
+    payload, = client._submit_socket.send_multipart.call_args[0][0]
+    assert json.loads(payload.decode()) == expected_request
+    assert not future.done()
+    reply(client, {'error': None, 'handle': 1, 'id': 1})
+    assert future.result() == {'error': None, 'handle': 1}
+
+
+def test_submit_operation_with_invalid_request(client):
+    future = client.submit_operation('does_not_exist')
+    reply(client, {'error': 'invalid request', 'id': 1})
+    with pytest.raises(ValueError):
+        future.result()
+
+
+def test_submit_query_replies_out_of_order(client):
+    first = client.submit_query('first')
+    second = client.submit_query('second')
+    reply(client, {'error': None, 'data': 2, 'id': 2})
+    reply(client, {'error': 'bad bad happened', 'data': None, 'id': 1})
+    assert second.result() == 2
+    with pytest.raises(RobotError):
+        first.result()
 
 
 def test_handle_update_sets_attrs_for_values(client):
     mock_socket = MagicMock()
     message = {'type': 'values', 'data': {'lid_open_status': 'open'}}
-    mock_socket.recv_json.return_value = message
+    mock_socket.recv_multipart.return_value = [b'topic.', json.dumps(message).encode()]
     client._handle_update(mock_socket)
     assert client.lid_open_status == 'open'
 
 
+def test_handle_update_rebuilds_arrays(client):
+    mock_socket = MagicMock()
+    header = {'type': 'values', 'data': {'trajectory': None},
+              'arrays': [['trajectory', '<f8', [2, 2]]]}
+    buffer = np.arange(4, dtype='<f8').tobytes()
+    mock_socket.recv_multipart.return_value = [
+        b'values.trajectory.', json.dumps(header).encode(), buffer
+    ]
+    client._handle_update(mock_socket)
+    assert client.trajectory.shape == (2, 2)
+    assert client.trajectory[1, 1] == 3
+
+
 def test_handle_update_calls_callbacks(client):
     client.on_lid_open_status = MagicMock()
     mock_socket = MagicMock()
     message = {'type': 'values', 'data': {'lid_open_status': 'open'}}
-    mock_socket.recv_json.return_value = message
+    mock_socket.recv_multipart.return_value = [b'topic.', json.dumps(message).encode()]
     client._handle_update(mock_socket)
     assert client.on_lid_open_status.call_args == call('open')
 
@@ -49,7 +83,7 @@ def test_handle_calls_delegate_callbacks(client):
     client.delegate = MagicMock()
     mock_socket = MagicMock()
     message = {'type': 'values', 'data': {'lid_open_status': 'open'}}
-    mock_socket.recv_json.return_value = message
+    mock_socket.recv_multipart.return_value = [b'topic.', json.dumps(message).encode()]
     client._handle_update(mock_socket)
     assert client.delegate.on_lid_open_status.call_args == call('open')
 
@@ -62,16 +96,16 @@ def test_refresh(client):
     assert client.some_robot_attr == 1
 
 
-def test_run_operation_adds_callback(client):
+def test_submit_operation_adds_callback(client):
     callback = Mock()
-    client._reply_queue.put({'error': None, 'handle': 1})
-    client.run_operation('set_lid', value=1, callback=callback)
-    assert client._operation_callbacks[1] == callback
+    client.submit_operation('set_lid', value=1, callback=callback)
+    reply(client, {'error': None, 'handle': 1, 'id': 1})
+    assert client._operation_callbacks[1] == (callback, None)
 
 
 def test_operation_callbacks(client):
     callback = Mock()
-    client._operation_callbacks[1] = callback
+    client._operation_callbacks[1] = (callback, None)
     message = {
         'type': 'operation',
         'handle': 1,
@@ -80,7 +114,7 @@ def test_operation_callbacks(client):
         'error': 'bad bad happened',
     }
     mock_socket = MagicMock()
-    mock_socket.recv_json.return_value = message
+    mock_socket.recv_multipart.return_value = [b'topic.', json.dumps(message).encode()]
     client._handle_update(mock_socket)
     assert callback.call_args == call(handle=1, stage='update',
                                       message='test', error='bad bad happened')
@@ -91,3 +125,244 @@ def test_clear(client):
     client.clear('status')
     assert client.run_operation.call_args == call('clear', level='status',
                                                   callback=None)
+
+
+def values_message(sequence, **data):
+    return {'type': 'values', 'data': data, 'sequence': sequence}
+
+
+def test_sync_applies_newer_early_updates(client):
+    client._handle_sequenced_values(values_message(4, at_home=0))
+    client._handle_sequenced_values(values_message(6, at_home=1))
+    client.run_query = MagicMock(return_value={'sequence': 5,
+                                               'data': {'at_home': 'synced'}})
+    client.sync()
+    assert client.at_home == 1
+    assert client._sequence == 6
+
+
+def test_values_already_applied_are_ignored(client):
+    client._sequence = 5
+    client._handle_sequenced_values(values_message(5, at_home=0))
+    assert not hasattr(client, 'at_home')
+
+
+def test_gap_fetches_changes(client):
+    client._sequence = 5
+    client.run_query = MagicMock(return_value={'sequence': 7,
+                                               'data': {'motors_on': 1,
+                                                        'at_home': 1}})
+    client._handle_sequenced_values(values_message(7, at_home=1))
+    assert client.run_query.call_args == call('changes_since', sequence=5)
+    assert client.motors_on == 1
+    assert client._sequence == 7
+    client._handle_sequenced_values(values_message(8, at_home=0))
+    assert client.at_home == 0
+    assert client._sequence == 8
+
+
+def test_gap_falls_back_to_sync(client):
+    client._sequence = 5
+
+    def run_query(name, **parameters):
+        if name == 'changes_since':
+            raise RobotError('sequence 5 is no longer available')
+        return {'sequence': 100, 'data': {'at_home': 'synced', 'motors_on': 1}}
+
+    client.run_query = run_query
+    client.motors_on = 1
+    client.on_at_home = MagicMock()
+    client.on_motors_on = MagicMock()
+    client._handle_sequenced_values(values_message(99, at_home=1))
+    assert client.at_home == 'synced'
+    assert client._sequence == 100
+    assert client.on_at_home.call_args == call('synced')
+    assert not client.on_motors_on.called
+
+
+def test_initial_sync_skips_callbacks(client):
+    client.on_at_home = MagicMock()
+    client.run_query = MagicMock(return_value={'sequence': 5,
+                                               'data': {'at_home': 1}})
+    client._sync(notify=False)
+    assert client.at_home == 1
+    assert not client.on_at_home.called
+
+
+def test_sync_if_not_replayed(client):
+    client._handle_sequenced_values(values_message(4, at_home=0))
+    client._handle_sequenced_values(values_message(5, at_home=1))
+    assert not hasattr(client, 'at_home')
+    client.run_query = MagicMock(return_value={'sequence': 4,
+                                               'data': {'at_home': 0}})
+    client._sync_if_not_replayed()
+    assert client.at_home == 1
+    assert client._sequence == 5
+    client._sync_if_not_replayed()
+    assert client.run_query.call_count == 1
+
+
+def test_unsynced_values_are_capped(client):
+    for sequence in range(1, client.MAX_UNSYNCED_VALUES + 11):
+        client._handle_sequenced_values(values_message(sequence, at_home=1))
+    assert len(client._unsynced_values) == client.MAX_UNSYNCED_VALUES
+    assert client._unsynced_values[0]['sequence'] == 11
+
+
+def test_filtered_client_ignores_sequence():
+    client = RobotClient(attrs=['at_home'])
+    client._sequence = 5
+    client._handle_sequenced_values(values_message(9, at_home=1))
+    assert client.at_home == 1
+
+
+def test_replayed_values_sync_client():
+    client = RobotClient(initial_sync=False)
+    client._handle_sequenced_values(dict(values_message(7, at_home=1, motors_on=1),
+                                         replay=True))
+    client._handle_sequenced_values(values_message(6, at_home=1))
+    client._handle_sequenced_values(values_message(8, at_home=0))
+    assert client._sequence == 8
+    assert (client.at_home, client.motors_on) == (0, 1)
+
+
+def test_synced_client_ignores_replays(client):
+    client.on_at_home = Mock()
+    client._sequence = 7
+    client._handle_sequenced_values(dict(values_message(7, at_home=1), replay=True))
+    client._handle_sequenced_values(dict(values_message(5, at_home=1), replay=True))
+    assert not client.on_at_home.called
+
+
+def test_replay_during_initial_sync_is_silent(client):
+    client.on_at_home = Mock()
+    client._sequence = None
+    client._handle_sequenced_values(dict(values_message(7, at_home=1), replay=True))
+    client.run_query = Mock(return_value={'sequence': 7, 'data': {'at_home': 1}})
+    client._sync(notify=False)
+    assert client.at_home == 1
+    assert not client.on_at_home.called
+
+
+def test_filtered_client_ignores_unchanged_replays():
+    client = RobotClient(attrs=['at_home'])
+    client.on_at_home = Mock()
+    client._handle_sequenced_values(dict(values_message(7, at_home=1), replay=True))
+    client._handle_sequenced_values(dict(values_message(8, at_home=1), replay=True))
+    assert client.on_at_home.call_args_list == [call(1)]
+
+
+def test_submit_batch(client):
+    callback = Mock()
+    future = client.submit_batch([
+        {'operation': 'refresh', 'parameters': {}},
+        {'operation': 'clear', 'parameters': {'level': 'all'},
+         'callback': callback},
+    ])
+    frames = client._submit_socket.send_multipart.call_args[0][0]
+    request = json.loads(frames[0].decode())
+    assert request['operation'] == 'batch'
+    operation_request = request['parameters']['requests'][1]
+    assert operation_request.pop('correlation_id')
+    assert operation_request == {
+        'operation': 'clear', 'parameters': {'level': 'all'},
+    }
+    replies = [{'error': None, 'data': {}}, {'error': None, 'handle': 3}]
+    reply(client, {'error': None, 'data': replies, 'id': 1})
+    assert future.result() == replies
+    assert client._operation_callbacks[3] == (callback, None)
+
+
+def test_subscribe(client):
+    first, second = Mock(), Mock()
+    client.subscribe('at_home', first)
+    client.subscribe('at_home', second)
+    client._handle_values({'at_home': 1})
+    client.unsubscribe('at_home', first)
+    client._handle_values({'at_home': 0})
+    assert first.call_args_list == [call(1)]
+    assert second.call_args_list == [call(1), call(0)]
+
+
+def test_callbacks_follow_delegate_changes(client):
+    first, second = MagicMock(), MagicMock()
+    client.delegate = first
+    client._handle_values({'at_home': 1})
+    client.delegate = second
+    client._handle_values({'at_home': 0})
+    assert first.on_at_home.call_args_list == [call(1)]
+    assert second.on_at_home.call_args_list == [call(0)]
+
+
+def operation_message(client, stage, **fields):
+    message = dict({'type': 'operation', 'handle': 1, 'stage': stage,
+                    'message': None, 'error': None}, **fields)
+    mock_socket = MagicMock()
+    mock_socket.recv_multipart.return_value = [b'topic.', json.dumps(message).encode()]
+    client._handle_update(mock_socket)
+
+
+def test_echoed_correlation_id_skips_handle_registration(client):
+    callback = Mock()
+    client.submit_operation('calibrate', callback=callback)
+    frames = client._submit_socket.send_multipart.call_args[0][0]
+    correlation_id = json.loads(frames[0].decode())['correlation_id']
+    reply(client, {'error': None, 'handle': 1, 'correlation_id': correlation_id,
+                   'id': 1})
+    assert list(client._operation_callbacks) == [correlation_id]
+    operation_message(client, 'end', correlation_id=correlation_id)
+    assert callback.call_args[1]['stage'] == 'end'
+    assert client._operation_callbacks == {}
+
+
+def test_operation_callbacks_are_removed_on_end(client):
+    callback = Mock()
+    client._operation_callbacks[1] = (callback, None)
+    operation_message(client, 'start')
+    operation_message(client, 'end')
+    assert callback.call_count == 2
+    assert client._operation_callbacks == {}
+
+
+def test_operation_callbacks_expire():
+    client = RobotClient(operation_callback_timeout=.01)
+    client._register_operation_callback(1, Mock())
+    time.sleep(.02)
+    client._register_operation_callback(2, Mock())
+    assert list(client._operation_callbacks) == [2]
+
+
+def test_start_operation(client):
+    future = client.start_operation('calibrate')
+    reply(client, {'error': None, 'handle': 1, 'id': 1})
+    assert not future.done()
+    operation_message(client, 'end', message='calibrated')
+    assert future.result(0) == 'calibrated'
+
+
+def test_start_operation_with_error(client):
+    future = client.start_operation('calibrate')
+    reply(client, {'error': None, 'handle': 1, 'id': 1})
+    operation_message(client, 'end', error='bad bad happened')
+    with pytest.raises(RobotError):
+        future.result(0)
+
+
+def test_start_operation_with_invalid_request(client):
+    future = client.start_operation('calibrate')
+    reply(client, {'error': 'invalid request', 'id': 1})
+    with pytest.raises(ValueError):
+        future.result(0)
+
+
+def test_operation_updates_before_reply_reach_callback(client):
+    callback = Mock()
+    future = client.submit_operation('calibrate', callback=callback)
+    frames = client._submit_socket.send_multipart.call_args[0][0]
+    correlation_id = json.loads(frames[0].decode())['correlation_id']
+    operation_message(client, 'start', correlation_id=correlation_id)
+    operation_message(client, 'end', correlation_id=correlation_id)
+    reply(client, {'error': None, 'handle': 1, 'id': 1})
+    assert future.result(0)['handle'] == 1
+    assert [c[1]['stage'] for c in callback.call_args_list] == ['start', 'end']
+    assert client._operation_callbacks == {}
@@ -0,0 +1,80 @@
+from unittest.mock import Mock, call
+import asyncio
+import json
+
+from aspyrobot.client import RobotClient
+from aspyrobot.dispatch import QueueDispatcher, AsyncioDispatcher
+
+
+def test_queue_dispatcher_batches_and_coalesces():
+    dispatcher = QueueDispatcher()
+    func = Mock()
+    dispatcher.post('a', func, 1)
+    dispatcher.post(None, func, 'operation')
+    dispatcher.post('a', func, 2)
+    dispatcher.post('b', func, 3)
+    assert dispatcher.queue.qsize() == 1
+    dispatcher.queue.get()()
+    assert func.call_args_list == [call(2), call('operation'), call(3)]
+
+
+def test_errors_do_not_stop_delivery():
+    dispatcher = QueueDispatcher()
+    func = Mock(side_effect=[Exception('bad'), None])
+    dispatcher.post(None, func, 1)
+    dispatcher.post(None, func, 2)
+    dispatcher.flush()
+    assert func.call_args_list == [call(1), call(2)]
+
+
+def test_asyncio_dispatcher():
+    loop = asyncio.new_event_loop()
+    dispatcher = AsyncioDispatcher(loop)
+    func = Mock()
+    dispatcher.post('a', func, 1)
+    dispatcher.post('a', func, 2)
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+    assert func.call_args_list == [call(2)]
+
+
+def test_client_delivers_callbacks_through_dispatcher():
+    dispatcher = QueueDispatcher()
+    client = RobotClient(dispatcher=dispatcher)
+    client.on_at_home = Mock()
+    operation_callback = Mock()
+    client._operation_callbacks[1] = (operation_callback, None)
+    client._handle_values({'at_home': 1})
+    client._handle_values({'at_home': 0})
+    client._handle_values({'motors_on': 1})  # No callbacks so nothing posted
+    client._handle_update(Mock(recv_multipart=Mock(return_value=[
+        b'operation.1.', b'{"type": "operation", "handle": 1, "stage": "end"}',
+    ])))
+    assert client.at_home == 0
+    assert not client.on_at_home.called
+    dispatcher.queue.get()()
+    assert dispatcher.queue.empty()
+    assert client.on_at_home.call_args_list == [call(0)]
+    assert operation_callback.call_args == call(handle=1, stage='end',
+                                                message=None, error=None)
+
+
+def test_start_operation_completes_without_dispatcher_flush():
+    dispatcher = QueueDispatcher()
+    client = RobotClient(dispatcher=dispatcher)
+    client._submit_socket = Mock()
+    callback = Mock()
+    future = client.start_operation('calibrate', callback=callback)
+    request = json.loads(client._submit_socket.send_multipart.call_args[0][0][0])
+    client._handle_update(Mock(recv_multipart=Mock(return_value=[
+        b'operation.1.', json.dumps({
+            'type': 'operation', 'handle': 1, 'stage': 'end',
+            'message': 'calibrated', 'error': None,
+            'correlation_id': request['correlation_id'],
+        }).encode(),
+    ])))
+    assert future.result(0) == 'calibrated'
+    assert not callback.called
+    dispatcher.queue.get()()
+    assert callback.call_args == call(handle=1, stage='end', message='calibrated',
+                                      error=None)
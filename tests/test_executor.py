@@ -0,0 +1,44 @@
+from threading import Event, Lock
+import time
+
+import pytest
+
+from aspyrobot.executor import OperationExecutor
+
+
+def test_operations_run():
+    executor = OperationExecutor(2)
+    done = Event()
+    executor.submit(done.set)
+    assert done.wait(1)
+    executor.shutdown()
+
+
+def test_concurrency_is_limited():
+    executor = OperationExecutor(2)
+    lock = Lock()
+    running = []
+    peak = []
+
+    def operation():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(.02)
+        with lock:
+            running.pop()
+
+    for _ in range(10):
+        executor.submit(operation)
+    time.sleep(.3)
+    stats = executor.stats()
+    assert max(peak) == 2
+    assert stats['workers'] == 2
+    assert stats['started'] == 10
+    assert stats['max_queue_wait'] > .05
+    executor.shutdown()
+
+
+def test_max_workers_must_be_positive():
+    with pytest.raises(ValueError):
+        OperationExecutor(0)
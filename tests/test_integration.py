@@ -1,11 +1,15 @@
 from types import MethodType
+import asyncio
+from threading import Thread
 import time
 from unittest.mock import MagicMock
 
+import numpy
 import pytest
 
-from aspyrobot import RobotClient, RobotServer
-from aspyrobot.server import query_operation
+from aspyrobot import (RobotClient, RobotServer, AsyncRobotClient, Relay,
+                       LastValueCache)
+from aspyrobot.server import query_operation, background_operation
 
 
 @pytest.fixture
@@ -41,3 +45,202 @@ def test_queries_raise_exception(server, client):
     with pytest.raises(Exception) as error:
         client.run_query('query')
     assert str(error.value) == 'bad bad happened'
+
+
+def test_slow_query_does_not_block_other_clients():
+    robot = MagicMock()
+    robot.snapshot.return_value = {}
+    server = RobotServer(robot=robot, logger=MagicMock(), request_workers=4,
+                         update_addr='tcp://*:2010', request_addr='tcp://*:2011')
+
+    @query_operation
+    def slow_query(server):
+        time.sleep(.5)
+        return 'slow'
+
+    server.slow_query = MethodType(slow_query, server)
+    server.setup()
+    slow_client, fast_client = (
+        RobotClient(update_addr='tcp://localhost:2010',
+                    request_addr='tcp://localhost:2011')
+        for _ in range(2)
+    )
+    slow_client.setup()
+    fast_client.setup()
+    thread = Thread(target=slow_client.run_query, args=('slow_query',))
+    thread.start()
+    time.sleep(.05)
+    t0 = time.time()
+    fast_client.run_query('refresh')
+    assert time.time() - t0 < .25
+    thread.join()
+    server.shutdown()
+
+
+def test_async_client(server):
+    @background_operation
+    def operation(server, handle, value): return value * 2
+    server.operation = MethodType(operation, server)
+
+    async def run():
+        client = AsyncRobotClient()
+        await client.setup()
+        reply = await client.run_operation('operation', value=2)
+        result = await asyncio.wait_for(client.wait_for_operation(reply['handle']),
+                                        timeout=1)
+        client.close()
+        return result
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(run()) == 4
+    loop.close()
+
+
+def test_msgpack_codec():
+    robot = MagicMock()
+    robot.snapshot.return_value = {'status': 1}
+    server = RobotServer(robot=robot, logger=MagicMock(), codec='msgpack',
+                         update_addr='tcp://*:2020', request_addr='tcp://*:2021')
+    server.setup()
+    client = RobotClient(update_addr='tcp://localhost:2020',
+                         request_addr='tcp://localhost:2021', codec='msgpack')
+    client.setup()
+    assert client.status == 1
+    server.shutdown()
+
+
+def test_array_values(server, client):
+    positions = numpy.linspace(0, 1, 1000)
+    time.sleep(.1)  # Let the subscription reach the server
+    server.values_update({'positions': positions})
+    time.sleep(.1)
+    assert numpy.array_equal(client.positions, positions)
+
+
+def test_client_only_receives_subscribed_attrs(server):
+    client = RobotClient(attrs=['at_home'], operations=False)
+    client.setup()
+    time.sleep(.1)
+    server.values_update({'at_home': 1, 'motors_on': 1})
+    time.sleep(.1)
+    assert client.at_home == 1
+    assert not hasattr(client, 'motors_on')
+
+
+def test_last_value_cache_syncs_new_clients():
+    robot = MagicMock()
+    robot.snapshot.return_value = {}
+    server = RobotServer(robot=robot, logger=MagicMock(), last_value_cache=True,
+                         update_addr='tcp://*:2030', request_addr='tcp://*:2031')
+    server.setup()
+    time.sleep(.1)
+    server.values_update({'at_home': 1, 'motors_on': 0})
+    time.sleep(.1)
+    client = RobotClient(update_addr='tcp://localhost:2030',
+                         request_addr='tcp://localhost:2031', initial_sync=False)
+    client.setup()
+    time.sleep(.1)
+    assert client.at_home == 1
+    assert client.motors_on == 0
+    assert not robot.snapshot.called
+    server.values_update({'at_home': 0})
+    time.sleep(.1)
+    assert client.at_home == 0
+    server.shutdown()
+
+
+def test_last_value_cache_with_unsplit_values():
+    robot = MagicMock()
+    robot.snapshot.return_value = {}
+    server = RobotServer(robot=robot, logger=MagicMock(), last_value_cache=True,
+                         split_values=False, update_addr='tcp://*:2050',
+                         request_addr='tcp://*:2051')
+    server.setup()
+    time.sleep(.1)
+    server.values_update({'at_home': 1, 'motors_on': 0})
+    server.values_update({'motors_on': 1})
+    time.sleep(.1)
+    client = RobotClient(update_addr='tcp://localhost:2050',
+                         request_addr='tcp://localhost:2051', initial_sync=False)
+    client.setup()
+    time.sleep(.1)
+    assert client.at_home == 1
+    assert client.motors_on == 1
+    assert client._sequence == 2
+    assert not robot.snapshot.called
+    server.shutdown()
+
+
+def test_client_syncs_when_cache_is_empty(monkeypatch):
+    monkeypatch.setattr(RobotClient, 'REPLAY_TIMEOUT', .2)
+    robot = MagicMock()
+    robot.snapshot.return_value = {'at_home': 0}
+    server = RobotServer(robot=robot, logger=MagicMock(), last_value_cache=True,
+                         update_addr='tcp://*:2052', request_addr='tcp://*:2053')
+    server.setup()
+    client = RobotClient(update_addr='tcp://localhost:2052',
+                         request_addr='tcp://localhost:2053', initial_sync=False)
+    client.setup()
+    time.sleep(.4)
+    assert client.at_home == 0
+    assert robot.snapshot.called
+    server.values_update({'at_home': 1})
+    time.sleep(.1)
+    assert client.at_home == 1
+    server.shutdown()
+
+
+def test_new_client_replay_does_not_notify_existing_clients():
+    robot = MagicMock()
+    robot.snapshot.return_value = {'at_home': 1}
+    server = RobotServer(robot=robot, logger=MagicMock(), last_value_cache=True,
+                         update_addr='tcp://*:2054', request_addr='tcp://*:2055')
+    server.setup()
+    time.sleep(.1)
+    server.values_update({'at_home': 1})
+    time.sleep(.1)
+    clients = [RobotClient(update_addr='tcp://localhost:2054',
+                           request_addr='tcp://localhost:2055') for _ in range(2)]
+    clients[0].on_at_home = MagicMock()
+    clients[0].setup()
+    time.sleep(.1)
+    clients[1].setup()
+    time.sleep(.1)
+    assert clients[1].at_home == 1
+    assert not clients[0].on_at_home.called
+    server.shutdown()
+
+
+def test_chained_relays():
+    robot = MagicMock()
+    robot.snapshot.return_value = {}
+    server = RobotServer(robot=robot, logger=MagicMock(),
+                         update_addr='tcp://*:2040', request_addr='tcp://*:2041')
+    server.setup()
+    relays = [Relay('tcp://localhost:2040', 'tcp://*:2042'),
+              LastValueCache('tcp://localhost:2042', 'tcp://*:2043')]
+    for relay in relays:
+        Thread(target=relay.run, daemon=True).start()
+    time.sleep(.3)  # Allow for the cache reconnecting if it beat the relay bind
+    server.values_update({'at_home': 1})
+    time.sleep(.1)
+    client = RobotClient(update_addr='tcp://localhost:2043',
+                         request_addr='tcp://localhost:2041', initial_sync=False)
+    client.setup()
+    time.sleep(.1)
+    assert client.at_home == 1
+    server.values_update({'at_home': 0})
+    time.sleep(.1)
+    assert client.at_home == 0
+    for relay in relays:
+        relay.shutdown()
+    server.shutdown()
+
+
+def test_start_operation_sees_fast_operations_finish(server, client):
+    @background_operation
+    def fast_operation(server, handle): return 'done'
+    server.fast_operation = MethodType(fast_operation, server)
+    time.sleep(.1)  # Let the subscription reach the server
+    futures = [client.start_operation('fast_operation') for _ in range(20)]
+    assert [future.result(1) for future in futures] == ['done'] * 20
@@ -0,0 +1,68 @@
+from queue import Empty
+
+import pytest
+
+from aspyrobot.queues import PublishQueue
+
+
+def values(**data):
+    return {'type': 'values', 'data': data}
+
+
+def operation(stage):
+    return {'type': 'operation', 'handle': 1, 'stage': stage}
+
+
+def drain(queue):
+    messages = []
+    while not queue.empty():
+        messages.append(queue.get_nowait())
+    return messages
+
+
+def test_get_times_out():
+    queue = PublishQueue()
+    with pytest.raises(Empty):
+        queue.get(timeout=.01)
+
+
+def test_merge_keeps_newest_values():
+    queue = PublishQueue(maxsize=2)
+    queue.put(values(at_home=0, status=1))
+    queue.put(values(at_home=1))
+    queue.put(values(motors_on=1))
+    assert drain(queue) == [values(at_home=1, status=1), values(motors_on=1)]
+    assert queue.dropped == 1
+
+
+def test_merge_keeps_values_after_operations():
+    queue = PublishQueue(maxsize=2)
+    queue.put(values(at_home=0))
+    queue.put(operation('start'))
+    queue.put(values(at_home=1))
+    assert drain(queue) == [operation('start'), values(at_home=1)]
+
+
+def test_drop_oldest():
+    queue = PublishQueue(maxsize=2, policy='drop_oldest')
+    queue.put(operation('start'))
+    queue.put(values(at_home=0))
+    queue.put(values(at_home=1))
+    assert drain(queue) == [operation('start'), values(at_home=1)]
+    assert queue.dropped == 1
+
+
+def test_operation_messages_are_never_dropped():
+    queue = PublishQueue(maxsize=1, policy='drop_oldest')
+    queue.put(values(at_home=0))
+    queue.put(operation('start'))
+    queue.put(operation('end'))
+    queue.put(values(at_home=1))
+    queue.put(values(at_home=2))
+    assert drain(queue) == [operation('start'), operation('end'), values(at_home=2)]
+    assert queue.stats() == {'depth': 0, 'max_depth': 3, 'dropped': 2}
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        PublishQueue(policy='block')
@@ -1,3 +1,6 @@
+from threading import Timer
+import time
+
 import pytest
 from unittest.mock import MagicMock, call
 
@@ -13,9 +16,18 @@ def robot():
         setattr(robot, attr, MagicMock())
     robot.foreground_done.get.return_value = 1
     robot.foreground_error.get.return_value = 0
+    robot._on_foreground_done(value=1)
     yield robot
 
 
+def simulate_task(robot):
+    """Make the mock robot run a task when a command is issued."""
+    def put(value):
+        robot._on_foreground_done(value=0)
+        robot._on_foreground_done(value=1)
+    robot.generic_command.put.side_effect = put
+
+
 def test_run_task_raises_exception_if_busy(robot):
     robot.foreground_done.get.return_value = 0
     with pytest.raises(RobotError) as exception:
@@ -24,7 +36,7 @@ def test_run_task_raises_exception_if_busy(robot):
 
 
 def test_run_task_sets_args_and_issues_command(robot):
-    robot.foreground_done.get.side_effect = [1, 0, 1]
+    simulate_task(robot)
     robot.task_result.get.return_value = 'ok done'
     result = robot.run_task('calibrate', 'l 0')
     assert robot.task_args.put.call_args == call('l 0')
@@ -39,7 +51,7 @@ def test_run_task_raises_exception_if_op_doesnt_start(robot):
 
 
 def test_run_tasks_raises_exception_if_foreground_error_occurs(robot):
-    robot.foreground_done.get.side_effect = [1, 0, 1]
+    simulate_task(robot)
     robot.task_result.get.return_value = 'ok done'
     robot.foreground_error.get.return_value = 1
     robot.foreground_error_message.get.return_value = 'bad bad happened'
@@ -47,20 +59,91 @@ def test_run_tasks_raises_exception_if_foreground_error_occurs(robot):
         robot.run_task('calibrate', 'l 0')
 
 
-def test_snapshot():
+def test_run_task_times_out(robot):
+    robot.generic_command.put.side_effect = lambda value: (
+        robot._on_foreground_done(value=0)
+    )
+    with pytest.raises(RobotError) as exception:
+        robot.run_task('calibrate', 'l 0', timeout=.01)
+    assert 'timed out' in str(exception)
+
 
-    class SimpleRobot(Robot):
-        attrs = {
-            'num_attr': 'NUM_ATTR',
-            'str_attr': 'STR_ATTR',
-            'char_attr': 'CHAR_ATTR',
-        }
+def test_wait_for_foreground_free_wakes_on_monitor(robot):
+    robot._on_foreground_done(value=0)
+    Timer(.05, robot._on_foreground_done, kwargs={'value': 1}).start()
+    t0 = time.time()
+    robot._wait_for_foreground_free(timeout=1)
+    assert time.time() - t0 < .5
 
-        def __init__(self, prefix, **kwargs):
-            self.num_attr = MagicMock(type='ctrl_double', value=1)
-            self.str_attr = MagicMock(type='time_string', char_value='s')
-            self.char_attr = MagicMock(type='ctrl_char', char_value='c')
 
-    robot = SimpleRobot('TEST_ROBOT:')
+def test_run_task_with_put_completion_skips_argument_delay(robot, monkeypatch):
+    robot.put_completion = True
+    robot.task_args.put.return_value = 1
+    robot.task_result.get.return_value = 'ok done'
+    simulate_task(robot)
+    delays = []
+    monkeypatch.setattr('aspyrobot.robot.poll', delays.append)
+    assert robot.run_task('calibrate', 'l 0') == 'done'
+    assert robot.task_args.put.call_args == call('l 0', wait=True,
+                                                 timeout=robot.PUT_TIMEOUT)
+    assert delays == [robot.DELAY_TO_PROCESS]  # Only before reading the result
+
+
+def test_put_completion_falls_back_to_delay(robot, monkeypatch):
+    robot.put_completion = True
+    robot.task_args.put.return_value = -1  # Put timed out
+    robot.generic_command.put.return_value = 1
+    delays = []
+    monkeypatch.setattr('aspyrobot.robot.poll', delays.append)
+    robot.run_background_task('ResetRobotStatus', 'all')
+    assert delays == [robot.DELAY_TO_PROCESS]
+
+
+def test_snapshot():
+    robot = Robot('TEST_ROBOT:')
+    robot._update_state(attr='status', value=1, char_value='1', type='ctrl_double')
+    robot._update_state(attr='model', value=None, char_value='s',
+                        type='time_string')
+    robot._update_state(attr='client_update', value=[99], char_value='c',
+                        type='ctrl_char')
     response = robot.snapshot()
-    assert response == {'num_attr': 1, 'str_attr': 's', 'char_attr': 'c'}
+    assert response['status'] == 1
+    assert response['model'] == 's'
+    assert response['client_update'] == 'c'
+    assert response['at_home'] is None
+    assert set(response) == set(robot.attrs)
+
+
+def test_snapshot_is_a_copy():
+    robot = Robot('TEST_ROBOT:')
+    snapshot = robot.snapshot()
+    robot._update_state(attr='status', value=1, char_value='1', type='ctrl_double')
+    assert snapshot['status'] is None
+
+
+def test_stale_attrs():
+    robot = Robot('TEST_ROBOT:')
+    assert 'status' in robot.stale_attrs()
+    robot._update_state(attr='status', value=1, char_value='1', type='ctrl_double')
+    assert 'status' not in robot.stale_attrs()
+    sequence = robot.state_sequence
+    robot._on_connection_change(pvname='TEST_ROBOT:RSTATUS_MON', conn=False)
+    assert 'status' in robot.stale_attrs()
+    assert robot.state_sequence > sequence
+
+
+def test_connect_reports_failed_attrs():
+    robot = Robot('TEST_ROBOT:')
+    for attr, suffix in robot.attrs.items():
+        if attr != 'closest_point':
+            robot._on_connection_change(pvname='TEST_ROBOT:' + suffix, conn=True)
+    t0 = time.time()
+    assert robot.connect(timeout=.1) == ['closest_point']
+    assert time.time() - t0 < .5
+
+
+def test_connect_returns_when_all_connected():
+    robot = Robot('TEST_ROBOT:')
+    for suffix in robot.attrs.values():
+        robot._on_connection_change(pvname='TEST_ROBOT:' + suffix, conn=True)
+    assert robot.connect(timeout=5) == []
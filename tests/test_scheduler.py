@@ -0,0 +1,85 @@
+from threading import Event
+from unittest.mock import MagicMock, call
+
+from aspyrobot.scheduler import ForegroundScheduler
+
+
+def blocked_scheduler():
+    """Return a scheduler running an operation that waits for an event."""
+    scheduler = ForegroundScheduler(MagicMock())
+    started, release = Event(), Event()
+
+    def blocking_operation(handle):
+        started.set()
+        release.wait(1)
+
+    scheduler.submit(0, blocking_operation, {})
+    started.wait(1)
+    return scheduler, release
+
+
+def test_operations_run_by_priority():
+    scheduler, release = blocked_scheduler()
+    order = []
+    finished = Event()
+    scheduler.submit(1, lambda handle: order.append(handle), {})
+    scheduler.submit(2, lambda handle: order.append(handle), {}, priority=5)
+    scheduler.submit(3, lambda handle: finished.set(), {})
+    assert scheduler.queued() == [2, 1, 3]
+    release.set()
+    assert finished.wait(1)
+    assert order == [2, 1]
+    scheduler.shutdown()
+
+
+def test_queued_updates_report_position():
+    scheduler, release = blocked_scheduler()
+    scheduler.submit(1, MagicMock(), {})
+    scheduler.submit(2, MagicMock(), {}, priority=1)
+    assert scheduler.operation_update.call_args_list[-3:] == [
+        call(1, stage='queued', message=1),
+        call(2, stage='queued', message=1),
+        call(1, stage='queued', message=2),
+    ]
+    release.set()
+    scheduler.shutdown()
+
+
+def test_cancel():
+    scheduler, release = blocked_scheduler()
+    operation = MagicMock()
+    scheduler.submit(1, operation, {})
+    assert scheduler.cancel(1) is True
+    assert scheduler.cancel(1) is False
+    assert scheduler.operation_update.call_args == call(1, stage='end',
+                                                        error='cancelled')
+    release.set()
+    scheduler.shutdown()
+    assert not operation.called
+
+
+def test_expired_operations_are_skipped():
+    scheduler, release = blocked_scheduler()
+    operation = MagicMock()
+    scheduler.submit(1, operation, {}, deadline=0)
+    finished = Event()
+    scheduler.submit(2, lambda handle: finished.set(), {})
+    release.set()
+    assert finished.wait(1)
+    assert not operation.called
+    assert call(1, stage='end', error='deadline expired') in \
+        scheduler.operation_update.call_args_list
+    scheduler.shutdown()
+
+
+def test_operations_wait_for_foreground_free():
+    free = Event()
+    scheduler = ForegroundScheduler(MagicMock(), foreground_free=free.is_set)
+    scheduler.POLL_INTERVAL = .01
+    finished = Event()
+    scheduler.submit(1, lambda handle: finished.set(), {})
+    assert not finished.wait(.1)
+    assert scheduler.queued() == [1]
+    free.set()
+    assert finished.wait(1)
+    scheduler.shutdown()
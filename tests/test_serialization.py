@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from aspyrobot.serialization import (JsonCodec, MsgpackCodec, get_codec, pack_message,
+                                     unpack_message, split_envelope, message_topic,
+                                     subscription_topics)
+
+
+@pytest.fixture(params=['json', 'msgpack'])
+def codec(request):
+    return get_codec(request.param)
+
+
+def test_round_trip(codec):
+    message = {'type': 'values', 'data': {'status': 0, 'model': 'G6-553S-II',
+                                          'task_progress': 0.5}}
+    assert codec.decode(codec.encode(message)) == message
+
+
+def test_numpy_scalars(codec):
+    message = {'data': {'status': np.int32(3), 'closest_point': np.float64(1.5)}}
+    assert codec.decode(codec.encode(message)) == {
+        'data': {'status': 3, 'closest_point': 1.5}
+    }
+
+
+def test_json_encodes_arrays_as_lists():
+    codec = JsonCodec()
+    message = {'data': {'waveform': np.arange(3)}}
+    assert codec.decode(codec.encode(message)) == {'data': {'waveform': [0, 1, 2]}}
+
+
+def test_msgpack_preserves_arrays():
+    codec = MsgpackCodec()
+    array = np.arange(6, dtype='<f4').reshape(2, 3)
+    decoded = codec.decode(codec.encode({'data': {'waveform': array}}))
+    waveform = decoded['data']['waveform']
+    assert waveform.dtype == array.dtype
+    assert np.array_equal(waveform, array)
+
+
+def test_get_codec_unknown():
+    with pytest.raises(ValueError):
+        get_codec('pickle')
+
+
+def test_pack_message_without_arrays(codec):
+    message = {'type': 'values', 'data': {'status': 1}}
+    frames = pack_message(codec, message)
+    assert len(frames) == 1
+    assert unpack_message(codec, frames) == message
+
+
+def test_pack_message_sends_arrays_as_frames(codec):
+    array = np.arange(12, dtype='<i2').reshape(3, 4)
+    message = {'type': 'values', 'data': {'status': 1, 'positions': array}}
+    frames = pack_message(codec, message)
+    assert len(frames) == 2
+    assert frames[1] is array
+    unpacked = unpack_message(codec, [bytes(frame) for frame in frames])
+    assert unpacked['data']['status'] == 1
+    assert unpacked['data']['positions'].dtype == array.dtype
+    assert np.array_equal(unpacked['data']['positions'], array)
+
+
+def test_split_envelope():
+    assert split_envelope([b'id', b'', b'payload']) == ([b'id', b''], [b'payload'])
+    assert split_envelope([b'payload']) == ([], [b'payload'])
+
+
+def test_message_topic():
+    assert message_topic('values', 'task') == b'values.task.'
+    assert not message_topic('values', 'task_args').startswith(
+        message_topic('values', 'task'))
+    assert message_topic('operation', 12) == b'operation.12.'
+
+
+def test_subscription_topics():
+    assert subscription_topics() == [b'values.', b'operation.']
+    assert subscription_topics(['status'], operations=[3]) == [b'values.status.',
+                                                               b'operation.3.']
+    assert subscription_topics([], operations=False) == []
+
+
+def test_pack_message_sends_nested_arrays_as_frames(codec):
+    array = np.arange(4, dtype='<f8')
+    message = {'error': None, 'data': {'sequence': 3,
+                                       'data': {'status': 1, 'trajectory': array}}}
+    frames = pack_message(codec, message)
+    assert len(frames) == 2
+    assert message['data']['data']['trajectory'] is array  # Not modified
+    unpacked = unpack_message(codec, [bytes(frame) for frame in frames])
+    assert unpacked['data']['sequence'] == 3
+    assert unpacked['data']['data']['status'] == 1
+    assert isinstance(unpacked['data']['data']['trajectory'], np.ndarray)
+    assert np.array_equal(unpacked['data']['data']['trajectory'], array)
+
+
+def test_pack_message_sends_arrays_in_batch_replies(codec):
+    array = np.arange(3, dtype='<i4')
+    message = {'error': None, 'data': [{'error': None, 'data': 1},
+                                       {'error': None, 'data': {'waveform': array}}]}
+    frames = pack_message(codec, message)
+    assert len(frames) == 2
+    unpacked = unpack_message(codec, [bytes(frame) for frame in frames])
+    assert unpacked['data'][0] == {'error': None, 'data': 1}
+    assert np.array_equal(unpacked['data'][1]['data']['waveform'], array)
@@ -1,8 +1,12 @@
 from types import MethodType
+from collections import deque
+from threading import Thread
+import json
 import time
 from unittest.mock import MagicMock, call
 
 import pytest
+import zmq
 
 from aspyrobot.server import (RobotServer, query_operation, foreground_operation,
                               background_operation)
@@ -202,17 +206,17 @@ def test_background_operation_with_general_exception_logs_traceback(server):
 
 def test_on_robot_update(server):
     server.update_some_attr = MagicMock()
-    server._on_robot_update("{'set': 'some_attr', 'value': 5, 'extra': 'info'}")
+    server._handle_robot_update("{'set': 'some_attr', 'value': 5, 'extra': 'info'}")
     assert server.update_some_attr.call_args == call(value=5, extra='info')
 
 
 def test_on_robot_update_with_bad_string(server):
-    server._on_robot_update("{")
+    server._handle_robot_update("{")
     assert server.logger.error.called is True
 
 
 def test_on_robot_update_missing_method(server):
-    server._on_robot_update("{'set': 'unexpected_attr'}")
+    server._handle_robot_update("{'set': 'unexpected_attr'}")
     assert server.logger.warning.called is True
 
 
@@ -220,7 +224,7 @@ def test_on_robot_update_with_unexpected_attributes(server):
     def update_some_attr(value):
         pass
     server.update_some_attr = update_some_attr
-    server._on_robot_update("{'set': 'some_attr', 'value': 5, 'extra': 'info'}")
+    server._handle_robot_update("{'set': 'some_attr', 'value': 5, 'extra': 'info'}")
     assert server.logger.error.called is True
 
 
@@ -256,3 +260,304 @@ def test_clear(server):
     server.clear(1, 'all')
     expected_call = call('ResetRobotStatus', 'all')
     assert server.robot.run_background_task.call_args == expected_call
+
+
+def receive_published(server, n_messages):
+    server.update_addr = 'inproc://test-coalesce'
+    subscriber = server._zmq_context.socket(zmq.SUB)
+    subscriber.setsockopt(zmq.SUBSCRIBE, b'')
+    subscriber.setsockopt(zmq.RCVTIMEO, 1000)
+    subscriber.connect(server.update_addr)
+    thread = Thread(target=server._publisher, args=(server.update_addr,))
+    thread.start()
+    try:
+        return [subscriber.recv_multipart() for _ in range(n_messages)]
+    finally:
+        server.shutdown()
+        thread.join()
+        subscriber.close()
+
+
+def test_publisher_coalesces_values(server):
+    server.publish_interval = .2
+    server.split_values = False
+    for value in range(5):
+        server.values_update({'task_progress': value})
+    server.values_update({'at_home': 1})
+    server.operation_update(1, stage='start')
+    frames = receive_published(server, 3)
+    messages = [json.loads(payload.decode()) for _, payload in frames]
+    assert [topic for topic, _ in frames] == [b'values.', b'values.',
+                                              b'operation.1.']
+    assert messages[0] == {'type': 'values', 'data': {'task_progress': 0},
+                           'sequence': 1}
+    assert messages[1] == {'type': 'values',
+                           'data': {'task_progress': 4, 'at_home': 1},
+                           'sequence': 2}
+    assert messages[2]['type'] == 'operation'
+
+
+def test_publisher_splits_coalesced_values(server):
+    server.publish_interval = .2
+    for value in range(5):
+        server.values_update({'task_progress': value})
+    server.values_update({'at_home': 1})
+    server.operation_update(1, stage='start')
+    frames = receive_published(server, 4)
+    messages = [json.loads(payload.decode()) for _, payload in frames]
+    assert frames[0][0] == b'values.task_progress.'
+    assert messages[0] == {'type': 'values', 'data': {'task_progress': 0},
+                           'sequence': 1}
+    # The order of the split messages follows the coalesced dict's order
+    split = {(topic, json.dumps(message['data'])) for (topic, _), message
+             in zip(frames[1:3], messages[1:3])}
+    assert split == {(b'values.task_progress.', '{"task_progress": 4}'),
+                     (b'values.at_home.', '{"at_home": 1}')}
+    assert sorted(message['sequence'] for message in messages[1:3]) == [2, 3]
+    assert messages[3]['type'] == 'operation'
+
+
+def test_request_handler_drops_requests_without_delimiter(server):
+    request_addr = 'inproc://test-request-handler'
+    thread = Thread(target=server._request_handler, args=(request_addr,))
+    thread.start()
+    client = server._zmq_context.socket(zmq.DEALER)
+    client.setsockopt(zmq.RCVTIMEO, 1000)
+    client.connect(request_addr)
+    try:
+        client.send(b'{"operation": "refresh"}')
+        client.send_multipart([b'', b'{"operation": "missing", "id": 2}'])
+        frames = client.recv_multipart()
+    finally:
+        server.shutdown()
+        thread.join()
+        client.close(linger=0)
+    assert frames[0] == b''
+    assert json.loads(frames[1].decode())['id'] == 2
+    assert 'without delimiter' in server.logger.error.call_args_list[0][0][0]
+
+
+def test_setup_starts_with_disconnected_attrs(server):
+    server.robot.attrs = {'closest_point': 'CLOSESTP_MON'}
+    server.robot.connect.return_value = ['closest_point']
+    server.update_addr = 'inproc://test-degraded-updates'
+    server.request_addr = 'inproc://test-degraded-requests'
+    server.setup()
+    server.shutdown()
+    assert 'closest_point' in server.logger.warning.call_args[0][1]
+    assert server.robot.closest_point.add_callback.called
+
+
+def publish_values(server, *updates):
+    socket = MagicMock()
+    for update in updates:
+        server._publish(socket, {'type': 'values', 'data': update})
+
+
+def test_sync(server):
+    server.robot.snapshot.return_value = {'at_home': 1}
+    publish_values(server, {'at_home': 0}, {'at_home': 1})
+    response = server._process_request({'operation': 'sync'})
+    assert response['data'] == {'sequence': 2, 'data': {'at_home': 1}}
+
+
+def test_changes_since(server):
+    publish_values(server, {'at_home': 0, 'motors_on': 1}, {'at_home': 1})
+    response = server._process_request({'operation': 'changes_since',
+                                        'parameters': {'sequence': 1}})
+    assert response['data'] == {'sequence': 3, 'data': {'motors_on': 1,
+                                                        'at_home': 1}}
+
+
+def test_changes_since_with_unsplit_values(server):
+    server.split_values = False
+    publish_values(server, {'at_home': 0, 'motors_on': 1}, {'at_home': 1})
+    response = server._process_request({'operation': 'changes_since',
+                                        'parameters': {'sequence': 1}})
+    assert response['data'] == {'sequence': 2, 'data': {'at_home': 1}}
+
+
+def test_changes_since_expired_sequence(server):
+    server._change_log = deque(maxlen=2)
+    publish_values(server, {'at_home': 0}, {'at_home': 1}, {'at_home': 0})
+    response = server._process_request({'operation': 'changes_since',
+                                        'parameters': {'sequence': 0}})
+    assert 'no longer available' in response['error']
+    response = server._process_request({'operation': 'changes_since',
+                                        'parameters': {'sequence': 1}})
+    assert response['data'] == {'sequence': 3, 'data': {'at_home': 0}}
+
+
+def test_foreground_queue_runs_operations_in_turn():
+    robot = MagicMock()
+    robot.foreground_done.value = 1
+    server = RobotServer(robot=robot, logger=MagicMock(), foreground_queue=True)
+
+    @foreground_operation
+    def slow_operation(server, handle):
+        time.sleep(.05)
+
+    server.slow_operation = MethodType(slow_operation, server)
+    for _ in range(2):
+        server._process_request({'operation': 'slow_operation'})
+    stages = []
+    while len([update for update in stages if update[1] == 'end']) < 2:
+        message = server.publish_queue.get(timeout=1.)
+        stages.append((message['handle'], message['stage'], message['error']))
+    assert (2, 'queued', None) in stages
+    started = [update for update in stages if update[1] != 'queued']
+    assert started == [(1, 'start', None), (1, 'end', None),
+                       (2, 'start', None), (2, 'end', None)]
+
+
+def test_foreground_queue_waits_for_busy_robot():
+    robot = MagicMock()
+    robot.foreground_done.value = 0  # Eg running a task from the pendant
+    server = RobotServer(robot=robot, logger=MagicMock(), foreground_queue=True)
+    server._foreground_scheduler.POLL_INTERVAL = .01
+
+    @foreground_operation
+    def operation(server, handle): return 'done'
+
+    server.operation = MethodType(operation, server)
+    handle = server._process_request({'operation': 'operation'})['handle']
+    time.sleep(.1)
+    assert server._foreground_scheduler.queued() == [handle]
+    robot.foreground_done.value = 1
+    while True:
+        message = server.publish_queue.get(timeout=1.)
+        if message['stage'] == 'end':
+            break
+    assert message['error'] is None
+    assert message['message'] == 'done'
+    server.shutdown()
+
+
+def test_operation_specs_are_cached(server):
+    @query_operation
+    def query(server, value): return value
+    server.query = MethodType(query, server)
+    assert server._process_request({'operation': 'query',
+                                    'parameters': {'value': 1}})['data'] == 1
+    spec = server._operations['query']
+    server._process_request({'operation': 'query', 'parameters': {'value': 2}})
+    assert server._operations['query'] is spec
+
+    @query_operation
+    def query(server): return 'replaced'
+    server.query = MethodType(query, server)
+    assert server._process_request({'operation': 'query'})['data'] == 'replaced'
+
+
+def test_list_operations(server):
+    operations = server.list_operations()['data']
+    assert operations['clear'] == {
+        'type': 'background', 'parameters': ['level'], 'required': ['level'],
+        'doc': 'Clear robot state.',
+    }
+    assert operations['changes_since']['type'] == 'query'
+    assert 'values_update' not in operations
+
+
+def test_on_robot_update_without_set_key(server):
+    server._handle_robot_update("{'value': 5}")
+    assert server.logger.error.called is True
+
+
+def test_on_robot_update_method_cache_is_invalidated(server):
+    server.update_some_attr = MagicMock()
+    server._handle_robot_update("{'set': 'some_attr', 'value': 1}")
+    server.update_some_attr = MagicMock()
+    server._handle_robot_update("{'set': 'some_attr', 'value': 2}")
+    assert server.update_some_attr.call_args == call(value=2)
+
+
+def test_batch(server):
+    @query_operation
+    def query(server, value): return value * 2
+    server.query = MethodType(query, server)
+    server._operation_executor = MagicMock()
+    response = server._process_request({'operation': 'batch', 'parameters': {
+        'requests': [
+            {'operation': 'query', 'parameters': {'value': 2}},
+            {'operation': 'query', 'parameters': {}},
+            {'operation': 'clear', 'parameters': {'level': 'status'}},
+            {'operation': 'batch', 'parameters': {'requests': []}},
+        ],
+    }})
+    assert response['error'] is None
+    replies = response['data']
+    assert replies[0] == {'error': None, 'data': 4}
+    assert 'incorrect arguments' in replies[1]['error']
+    assert replies[2] == {'error': None, 'handle': 1}
+    assert 'nested batch' in replies[3]['error']
+    assert server._operation_executor.submit.call_args[1] == {'level': 'status'}
+
+
+def test_robot_updates_are_handled_in_order_off_the_callback_thread(server):
+    handled = []
+    server.update_some_attr = lambda value: handled.append(value)
+    for value in range(20):
+        server._on_robot_update("{'set': 'some_attr', 'value': %d}" % value)
+    time.sleep(.1)
+    assert handled == list(range(20))
+    stats = server.robot_update_stats()['data']
+    assert stats['started'] == 20
+    assert stats['queued'] == 0
+
+
+def test_operation_updates_include_correlation_id(server):
+    server._operation_executor = MagicMock()
+    response = server._process_request({'operation': 'clear',
+                                        'parameters': {'level': 'all'},
+                                        'correlation_id': 'abc:1'})
+    handle = response['handle']
+    assert response['correlation_id'] == 'abc:1'
+    server.operation_update(handle, stage='start')
+    server.operation_update(handle, stage='end')
+    server.operation_update(handle, stage='end')
+    updates = [server.publish_queue.get(timeout=1.) for _ in range(3)]
+    assert [update.get('correlation_id') for update in updates] == [
+        'abc:1', 'abc:1', None,
+    ]
+    history = server.operation_messages(handle)['data']
+    assert [update['stage'] for update in history] == ['start', 'end', 'end']
+    assert server.operation_messages(handle + 1)['error'] is not None
+
+
+def test_operation_history_is_limited(server):
+    server.OPERATION_HISTORY_SIZE = 2
+    for handle in range(3):
+        server.operation_update(handle, stage='end')
+    assert list(server._operation_history) == [1, 2]
+
+
+def test_operation_history_keeps_start_and_end(server):
+    server.OPERATION_HISTORY_UPDATES = 3
+    server.operation_update(1, stage='queued', message=1)
+    server.operation_update(1, stage='start')
+    for progress in range(10):
+        server.operation_update(1, message=progress)
+    server.operation_update(1, stage='end')
+    history = server.operation_messages(1)['data']
+    assert [(update['stage'], update['message']) for update in history] == [
+        ('queued', 1), ('start', ''), ('update', 8), ('update', 9), ('end', ''),
+    ]
+
+
+def test_foreground_queue_shutdown_ends_queued_operations():
+    robot = MagicMock()
+    robot.foreground_done.value = 0
+    server = RobotServer(robot=robot, logger=MagicMock(), foreground_queue=True)
+    operation = MagicMock()
+    handle = server._next_handle('abc:1')
+    server._foreground_scheduler.submit(handle, operation, {})
+    server.shutdown()
+    updates = []
+    while not server.publish_queue.empty():
+        updates.append(server.publish_queue.get())
+    end = [update for update in updates if update and update['stage'] == 'end']
+    assert end[0]['error'] == 'shutting down'
+    assert end[0]['correlation_id'] == 'abc:1'
+    assert server._correlation_ids == {}
+    assert not operation.called
@@ -0,0 +1,35 @@
+import pytest
+
+from aspyrobot.spel import parse_update
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("{'set': 'ports', 'value': [0, 1, -1], 'position': 'left'}",
+     ('ports', {'value': [0, 1, -1], 'position': 'left'})),
+    ("{'set': 'x', 'value': None, 'ok': True, 'bad': False, 'f': 1.5e3}",
+     ('x', {'value': None, 'ok': True, 'bad': False, 'f': 1500.})),
+    ("{'set': 'x', 'message': 'it\\'s \"None\"'}",
+     ('x', {'message': 'it\'s "None"'})),
+    ('{"set": "x", "message": "True"}', ('x', {'message': 'True'})),
+    ("{'set': 'x', 'value': (1, 2), 'trailing': 3,}",
+     ('x', {'value': (1, 2), 'trailing': 3})),
+    ("{'set': 'x', 'path': 'a\\/b'}", ('x', {'path': 'a\\/b'})),
+])
+def test_parse_update(text, expected):
+    assert parse_update(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    '{', "{'value': 1}", "['set', 'x']", "{'set': 1}", "{'set': 'x', 1: 2}",
+    "{'set': 'x', 'value': float('nan')}", '[' * 100000, None,
+    "{'set': 'x', 'value': NaN}", "{'set': 'x', 'value': Infinity}",
+    "{'set': 'x', 'value': -Infinity}",
+])
+def test_parse_update_rejects_invalid_messages(text):
+    with pytest.raises(ValueError):
+        parse_update(text)
+
+
+def test_parse_update_rejects_long_messages():
+    with pytest.raises(ValueError):
+        parse_update("{'set': 'x', 'value': '%s'}" % ('x' * 100), max_length=100)